@@ -4,11 +4,23 @@
 """
 import sqlite3
 import os
-from typing import Any, List, Dict, Optional, Union, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Any, List, Dict, Optional, Union, Tuple, Iterator, Iterable
 
 # 默认数据库文件路径
 DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "toolbox.db")
 
+# 建立连接时应用的默认PRAGMA设置
+# WAL日志 + synchronous=NORMAL 避免每次提交都执行fsync，临时表放在内存中，并启用内存映射读取
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+}
+
 
 class DatabaseManager:
     """
@@ -16,14 +28,25 @@ class DatabaseManager:
     提供数据库连接管理和常用操作方法
     """
     
-    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, pragmas: Optional[Dict[str, Any]] = None):
         """
         初始化数据库管理器
         
         Args:
             db_path: 数据库文件路径
+            pragmas: 需要覆盖的PRAGMA设置，值为None表示不设置该项
         """
         self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        # 每个线程复用一个长连接，避免每次操作都重新打开数据库文件
+        self._local = threading.local()
+        # 记录所有已创建的连接，便于统一关闭
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 已知存在的表名集合，首次使用时从数据库读取，避免重复执行建表语句
+        self._known_tables: Optional[set] = None
         self._ensure_database_exists()
     
     def _ensure_database_exists(self):
@@ -42,7 +65,84 @@ class DatabaseManager:
         Returns:
             sqlite3.Connection: 数据库连接对象
         """
-        return sqlite3.connect(self.db_path)
+        # 长连接上重复执行的SQL会命中sqlite3模块的预编译语句缓存
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name}={value}")
+        return conn
+    
+    def _get_conn(self) -> sqlite3.Connection:
+        """
+        获取当前线程的长连接，首次调用时创建
+        
+        Returns:
+            sqlite3.Connection: 当前线程复用的数据库连接
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+            conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _in_explicit_transaction(self) -> bool:
+        """
+        当前线程是否处于transaction()开启的事务中，此时单条语句执行后不单独提交
+        """
+        return getattr(self._local, 'transaction_depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        在一个事务中执行多条语句，全部成功后只提交一次，出错时整体回滚
+        嵌套使用时只有最外层提交
+        
+        Yields:
+            sqlite3.Connection: 当前线程的数据库连接
+        """
+        conn = self._get_conn()
+        depth = getattr(self._local, 'transaction_depth', 0)
+        if depth == 0 and not conn.in_transaction:
+            conn.execute("BEGIN")
+        self._local.transaction_depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.transaction_depth = depth
+            if depth == 0:
+                conn.rollback()
+            raise
+        self._local.transaction_depth = depth
+        if depth == 0:
+            conn.commit()
+    
+    def close(self):
+        """
+        关闭所有线程创建的数据库连接
+        """
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+            # 重置线程本地存储，之后的操作会重新建立连接
+            self._local = threading.local()
+        
+        for conn in connections:
+            try:
+                # 关闭前让SQLite根据本次会话的查询情况更新统计信息
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            finally:
+                conn.close()
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
     
     def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
         """
@@ -55,34 +155,69 @@ class DatabaseManager:
         Returns:
             List[Dict]: 查询结果列表，每行数据以字典形式返回
         """
-        result = []
-        conn = None
-        
         try:
-            conn = self.connect()
-            conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
-            cursor = conn.cursor()
+            cursor = self._get_conn().execute(query, params or ())
             
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            # 获取所有结果并转换为字典列表
+            return [dict(row) for row in cursor.fetchall()]
             
-            # 获取所有结果
-            rows = cursor.fetchall()
-            # 转换为字典列表
-            for row in rows:
-                result.append(dict(row))
+        except sqlite3.Error as e:
+            print(f"查询错误: {e}")
+            raise
+    
+    def iter_query(self, query: str, params: tuple = None, arraysize: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        以生成器方式执行查询语句，分批读取结果，适合结果集较大的查询
+        
+        Args:
+            query: SQL查询语句
+            params: 查询参数
+            arraysize: 每批读取的行数
+        
+        Yields:
+            Dict: 每行数据以字典形式返回
+        """
+        try:
+            cursor = self._get_conn().execute(query, params or ())
+            cursor.arraysize = arraysize
             
-            return result
+            while batch := cursor.fetchmany(arraysize):
+                yield from (dict(row) for row in batch)
             
         except sqlite3.Error as e:
             print(f"查询错误: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
+    
+    def _raw_cursor(self, query: str, params: tuple = None) -> sqlite3.Cursor:
+        """
+        执行查询并返回不经过sqlite3.Row包装的游标，结果行为普通元组
+        """
+        cursor = self._get_conn().cursor()
+        cursor.row_factory = None
+        return cursor.execute(query, params or ())
+    
+    def _execute_scalar(self, query: str, params: tuple = None) -> Optional[tuple]:
+        """
+        执行查询并只返回第一行
+        
+        Returns:
+            Optional[tuple]: 第一行数据，没有结果时返回None
+        """
+        try:
+            return self._raw_cursor(query, params).fetchone()
+        except sqlite3.Error as e:
+            print(f"查询错误: {e}")
+            raise
+    
+    def _execute_column(self, query: str, params: tuple = None) -> List[Any]:
+        """
+        执行查询并返回结果第一列组成的列表
+        """
+        try:
+            return [row[0] for row in self._raw_cursor(query, params)]
+        except sqlite3.Error as e:
+            print(f"查询错误: {e}")
+            raise
     
     def execute_non_query(self, query: str, params: tuple = None) -> int:
         """
@@ -98,34 +233,26 @@ class DatabaseManager:
         conn = None
         
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
-            
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            conn.commit()
+            conn = self._get_conn()
+            cursor = conn.execute(query, params or ())
+            if not self._in_explicit_transaction():
+                conn.commit()
             return cursor.rowcount
             
         except sqlite3.Error as e:
-            if conn:
+            # 在transaction()中出错时由事务整体回滚
+            if conn and not self._in_explicit_transaction():
                 conn.rollback()
             print(f"执行错误: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
     
-    def execute_many(self, query: str, params_list: List[tuple]) -> int:
+    def execute_many(self, query: str, params_list: Iterable[tuple]) -> int:
         """
-        批量执行SQL语句
+        批量执行SQL语句，所有语句在同一个事务中执行
         
         Args:
             query: SQL语句
-            params_list: 参数列表
+            params_list: 参数列表，可以是任意可迭代对象（如生成器），按需逐行读取
         
         Returns:
             int: 受影响的总行数
@@ -133,21 +260,44 @@ class DatabaseManager:
         conn = None
         
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
-            cursor.executemany(query, params_list)
-            conn.commit()
+            conn = self._get_conn()
+            # 显式开启事务，整批数据只提交一次
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            cursor = conn.executemany(query, params_list)
+            if not self._in_explicit_transaction():
+                conn.commit()
             return cursor.rowcount
             
         except sqlite3.Error as e:
-            if conn:
+            if conn and not self._in_explicit_transaction():
                 conn.rollback()
             print(f"批量执行错误: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
+    
+    def bulk_insert(self, table_name: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        """
+        批量插入数据
+        
+        Args:
+            table_name: 表名
+            columns: 列名列表
+            rows: 行数据，每行为与columns顺序一致的元组
+        
+        Returns:
+            int: 插入的行数
+        """
+        placeholders = ", ".join("?" * len(columns))
+        insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        return self.execute_many(insert_sql, rows)
+    
+    def _get_known_tables(self) -> set:
+        """
+        获取已知存在的表名集合，首次调用时从数据库读取
+        """
+        if self._known_tables is None:
+            self._known_tables = set(self.get_tables())
+        return self._known_tables
     
     def create_table(self, table_name: str, columns: Dict[str, str]):
         """
@@ -157,14 +307,20 @@ class DatabaseManager:
             table_name: 表名
             columns: 列定义字典 {列名: 列类型}
         """
+        # 表已存在时直接返回，不再执行建表语句
+        known_tables = self._get_known_tables()
+        if table_name in known_tables:
+            return
+        
         # 构建列定义字符串
-        columns_str = ", ".join([f"{name} {col_type}" for name, col_type in columns.items()])
+        columns_str = ", ".join(map(" ".join, columns.items()))
         
         # 构建创建表SQL
         create_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_str})"
         
         # 执行SQL
         self.execute_non_query(create_sql)
+        known_tables.add(table_name)
     
     def drop_table(self, table_name: str):
         """
@@ -175,6 +331,8 @@ class DatabaseManager:
         """
         drop_sql = f"DROP TABLE IF EXISTS {table_name}"
         self.execute_non_query(drop_sql)
+        if self._known_tables is not None:
+            self._known_tables.discard(table_name)
     
     def table_exists(self, table_name: str) -> bool:
         """
@@ -186,9 +344,8 @@ class DatabaseManager:
         Returns:
             bool: 表是否存在
         """
-        query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        result = self.execute_query(query, (table_name,))
-        return len(result) > 0
+        query = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1"
+        return self._execute_scalar(query, (table_name,)) is not None
     
     def get_tables(self) -> List[str]:
         """
@@ -198,8 +355,7 @@ class DatabaseManager:
             List[str]: 表名列表
         """
         query = "SELECT name FROM sqlite_master WHERE type='table'"
-        result = self.execute_query(query)
-        return [row['name'] for row in result]
+        return self._execute_column(query)
     
     def get_table_columns(self, table_name: str) -> List[Dict[str, str]]:
         """
@@ -225,16 +381,31 @@ def execute_query(query: str, params: tuple = None) -> List[Dict[str, Any]]:
     return db_manager.execute_query(query, params)
 
 
+def iter_query(query: str, params: tuple = None, arraysize: int = 1000) -> Iterator[Dict[str, Any]]:
+    """公共流式查询函数"""
+    return db_manager.iter_query(query, params, arraysize)
+
+
 def execute_non_query(query: str, params: tuple = None) -> int:
     """公共非查询函数"""
     return db_manager.execute_non_query(query, params)
 
 
-def execute_many(query: str, params_list: List[tuple]) -> int:
+def execute_many(query: str, params_list: Iterable[tuple]) -> int:
     """公共批量执行函数"""
     return db_manager.execute_many(query, params_list)
 
 
+def transaction():
+    """公共事务函数，用法: with transaction(): ..."""
+    return db_manager.transaction()
+
+
+def bulk_insert(table_name: str, columns: List[str], rows: Iterable[tuple]) -> int:
+    """公共批量插入函数"""
+    return db_manager.bulk_insert(table_name, columns, rows)
+
+
 def create_table(table_name: str, columns: Dict[str, str]):
     """公共创建表函数"""
     return db_manager.create_table(table_name, columns)
@@ -2,14 +2,24 @@ import sys
 import os
 import json
 import importlib
+import multiprocessing
+from functools import lru_cache
+from weakref import WeakValueDictionary
 
 # 全局引入数据库模块
 from database import db_manager, execute_query, execute_non_query, create_table, table_exists, get_tables
 from PyQt6.QtWidgets import QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QPushButton, QGridLayout, QLabel, QMessageBox
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QFont
 
 
+@lru_cache(maxsize=1)
+def _cached_config(path, mtime):
+    """读取并解析配置文件，按路径和修改时间缓存，文件修改后自动重新读取"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
 class Tool:
     """工具类，用于管理工具的基本信息"""
     def __init__(self, name, description, group, module=None, class_name=None):
@@ -18,17 +28,42 @@ class Tool:
         self.group = group
         self.module = module  # Python模块路径
         self.class_name = class_name  # 工具类名称
+        self.resolved_class = None  # 首次启动时解析出的工具类，之后直接复用
 
 
 class ToolBoxApp(QMainWindow):
+    # 工具按钮样式，通过toolButton属性选择器统一应用到所有工具按钮
+    _BTN_QSS = """
+            QPushButton[toolButton="true"] {
+                background-color: #f0f0f0;
+                border: 1px solid #ccc;
+                border-radius: 8px;
+                font-size: 14px;
+                padding: 10px;
+            }
+            QPushButton[toolButton="true"]:hover {
+                background-color: #e0e0e0;
+                border-color: #999;
+            }
+            QPushButton[toolButton="true"]:pressed {
+                background-color: #d0d0d0;
+            }
+        """
+    
     def __init__(self):
         super().__init__()
         # 初始化工具列表
         self.tools = self.initialize_tools()
         self.init_ui()
         
-        # 存储工具对话框引用，防止被垃圾回收
-        self.active_tool_dialogs = []
+        # 记录已打开的工具对话框，对话框由Qt父对象保持存活，这里只保存弱引用，销毁后自动移除
+        self.active_tool_dialogs = WeakValueDictionary()
+        
+        # 窗口大小变化时延迟重新排列按钮，合并连续的大小变化事件
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(50)
+        self._resize_timer.timeout.connect(self.reflow_tool_buttons)
         
         # 连接窗口大小变化事件，当窗口调整大小时重新计算布局
         self.resizeEvent = self.on_resize
@@ -37,8 +72,8 @@ class ToolBoxApp(QMainWindow):
         """加载配置文件"""
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            mtime = os.path.getmtime(config_path)
+            return _cached_config(config_path, mtime)
         except Exception as e:
             QMessageBox.critical(self, "配置错误", f"加载配置文件失败: {str(e)}")
             return {"tools": []}
@@ -47,6 +82,8 @@ class ToolBoxApp(QMainWindow):
         """从配置文件初始化所有工具"""
         config = self.load_config()
         tools = []
+        # 按分组归类工具，字典保持配置文件中分组首次出现的顺序
+        self.groups = {}
         
         for tool_config in config.get("tools", []):
             # 为Tool对象添加额外的配置信息
@@ -58,6 +95,10 @@ class ToolBoxApp(QMainWindow):
                 class_name=tool_config.get("class", None)
             )
             tools.append(tool)
+            self.groups.setdefault(tool.group, []).append(tool)
+        
+        # 按类名索引工具，工具对话框通过类名直接查找自己的配置
+        self.tools_by_class = {tool.class_name: tool for tool in tools if tool.class_name}
         
         return tools
     
@@ -72,6 +113,9 @@ class ToolBoxApp(QMainWindow):
         font.setPointSize(10)
         self.setFont(font)
         
+        # 工具按钮样式只在应用级别设置一次，由Qt统一解析，避免每个按钮单独解析样式表
+        QApplication.instance().setStyleSheet(self._BTN_QSS)
+        
         # 创建中心部件和标签页控件
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -90,16 +134,12 @@ class ToolBoxApp(QMainWindow):
     
     def create_tool_tabs(self):
         """根据工具分组创建标签页"""
-        # 保留配置文件中的分组顺序
-        groups = []
-        seen_groups = set()
-        for tool in self.tools:
-            if tool.group not in seen_groups:
-                groups.append(tool.group)
-                seen_groups.add(tool.group)
+        # 保存每个分组的布局和按钮，窗口大小变化时直接重新排列，无需重建控件
+        self._tab_layouts = {}
+        self._tab_buttons = {}
         
-        # 为每个分组创建标签页
-        for group in groups:
+        # 为每个分组创建标签页（self.groups保留配置文件中的分组顺序）
+        for group, group_tools in self.groups.items():
             # 创建标签页和布局
             tab_widget = QWidget()
             grid_layout = QGridLayout(tab_widget)
@@ -108,75 +148,80 @@ class ToolBoxApp(QMainWindow):
             # 设置布局垂直对齐方式为顶部对齐
             grid_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
             
-            # 获取当前分组的所有工具
-            group_tools = [tool for tool in self.tools if tool.group == group]
-            
-            # 使用固定的按钮宽度，确保一致性
-            button_width = 150
-            
-            # 获取标签页内容区域的实际可用宽度
-            # 主窗口宽度减去标签页边框、边距和滚动条可能占用的空间
-            available_width = self.width() - 50  # 调整边距估算值，使其更紧凑
-            
-            # 计算按钮和间距的总宽度
-            spacing = grid_layout.spacing()
-            item_width = button_width + spacing  # 每个按钮项占用的总宽度（包含右侧间距）
-            
-            # 动态计算每行最多可以显示的工具数量
-            # 确保至少显示1个工具，最多不超过10个（避免过多导致按钮过小）
-            max_columns = min(10, max(1, available_width // item_width))
-            
-            # 额外检查：如果计算出的列数导致按钮总宽度远小于可用宽度，则增加一列
-            total_width = max_columns * item_width - spacing  # 最后一个按钮不需要右侧间距
-            if total_width < available_width * 0.8 and max_columns < 10:
-                max_columns += 1
-            
-            # 创建工具按钮并添加到布局
-            for index, tool in enumerate(group_tools):
+            # 创建工具按钮
+            buttons = []
+            for tool in group_tools:
                 btn = self.create_tool_button(tool)
-                
-                # 计算行列位置
-                row = index // max_columns
-                col = index % max_columns
-                
                 # 设置按钮的固定宽度，确保无论工具数量多少，按钮宽度一致
                 btn.setFixedWidth(150)
-                
-                grid_layout.addWidget(btn, row, col)
-            
-            # 设置列拉伸因子，让按钮在水平方向均匀分布
-            # 移除之前可能设置的拉伸因子，避免影响新的布局
-            for i in range(max_columns):
-                try:
-                    grid_layout.setColumnStretch(i, 0)
-                except:
-                    pass  # 忽略可能的索引错误
-            
-            # 只在最后一列设置拉伸因子，使按钮组整体居中且不会浪费太多空间
-            if max_columns > 0:
-                grid_layout.setColumnStretch(max_columns, 1)
+                buttons.append(btn)
             
-            # 添加行拉伸因子，确保内容在垂直方向顶部对齐
-            grid_layout.setRowStretch(grid_layout.rowCount(), 1)
+            self._tab_layouts[group] = grid_layout
+            self._tab_buttons[group] = buttons
+            self.layout_tool_buttons(grid_layout, buttons)
             
             # 添加标签页
             self.tabs.addTab(tab_widget, group)
-            
-    def on_resize(self, event):
-        """窗口大小变化时重新计算布局"""
-        # 重新创建标签页，以更新工具按钮的布局
-        # 先保存当前选中的标签页索引
-        current_index = self.tabs.currentIndex()
+    
+    def calculate_max_columns(self, spacing):
+        """根据窗口宽度计算每行最多可以显示的工具数量"""
+        # 使用固定的按钮宽度，确保一致性
+        button_width = 150
         
-        # 清除所有标签页
-        self.tabs.clear()
+        # 获取标签页内容区域的实际可用宽度
+        # 主窗口宽度减去标签页边框、边距和滚动条可能占用的空间
+        available_width = self.width() - 50  # 调整边距估算值，使其更紧凑
         
-        # 重新创建标签页
-        self.create_tool_tabs()
+        # 计算按钮和间距的总宽度
+        item_width = button_width + spacing  # 每个按钮项占用的总宽度（包含右侧间距）
+        
+        # 动态计算每行最多可以显示的工具数量
+        # 确保至少显示1个工具，最多不超过10个（避免过多导致按钮过小）
+        max_columns = min(10, max(1, available_width // item_width))
+        
+        # 额外检查：如果计算出的列数导致按钮总宽度远小于可用宽度，则增加一列
+        total_width = max_columns * item_width - spacing  # 最后一个按钮不需要右侧间距
+        if total_width < available_width * 0.8 and max_columns < 10:
+            max_columns += 1
         
-        # 恢复之前选中的标签页
-        if current_index >= 0 and current_index < self.tabs.count():
-            self.tabs.setCurrentIndex(current_index)
+        return max_columns
+    
+    def layout_tool_buttons(self, grid_layout, buttons):
+        """按当前窗口宽度将工具按钮排列到网格布局中"""
+        max_columns = self.calculate_max_columns(grid_layout.spacing())
+        
+        # 先从布局中移除按钮（控件本身保留），再按新的行列位置放回
+        for btn in buttons:
+            grid_layout.removeWidget(btn)
+        
+        for index, btn in enumerate(buttons):
+            # 计算行列位置
+            row = index // max_columns
+            col = index % max_columns
+            grid_layout.addWidget(btn, row, col)
+        
+        # 清除之前设置的拉伸因子，避免影响新的布局
+        for i in range(grid_layout.columnCount()):
+            grid_layout.setColumnStretch(i, 0)
+        for i in range(grid_layout.rowCount()):
+            grid_layout.setRowStretch(i, 0)
+        
+        # 只在最后一列设置拉伸因子，使按钮组整体居中且不会浪费太多空间
+        grid_layout.setColumnStretch(max_columns, 1)
+        
+        # 添加行拉伸因子，确保内容在垂直方向顶部对齐
+        rows = (len(buttons) + max_columns - 1) // max_columns
+        grid_layout.setRowStretch(rows, 1)
+    
+    def reflow_tool_buttons(self):
+        """按当前窗口宽度重新排列所有标签页中的工具按钮"""
+        for group, grid_layout in self._tab_layouts.items():
+            self.layout_tool_buttons(grid_layout, self._tab_buttons[group])
+            
+    def on_resize(self, event):
+        """窗口大小变化时重新计算布局"""
+        # 拖动窗口时会连续触发大小变化事件，通过定时器合并，停止变化后再重新排列按钮
+        self._resize_timer.start()
         
         # 调用父类的resizeEvent方法
         super().resizeEvent(event)
@@ -187,23 +232,8 @@ class ToolBoxApp(QMainWindow):
         btn.setMinimumSize(150, 90)
         btn.setToolTip(tool.description)
         
-        # 设置按钮样式
-        btn.setStyleSheet("""
-            QPushButton {
-                background-color: #f0f0f0;
-                border: 1px solid #ccc;
-                border-radius: 8px;
-                font-size: 14px;
-                padding: 10px;
-            }
-            QPushButton:hover {
-                background-color: #e0e0e0;
-                border-color: #999;
-            }
-            QPushButton:pressed {
-                background-color: #d0d0d0;
-            }
-        """)
+        # 标记为工具按钮，使用应用级样式表中的按钮样式
+        btn.setProperty("toolButton", True)
         
         # 连接按钮点击事件
         btn.clicked.connect(lambda checked, t=tool: self.on_tool_clicked(t))
@@ -217,22 +247,20 @@ class ToolBoxApp(QMainWindow):
         try:
             # 尝试动态导入工具类
             if tool.module and tool.class_name:
-                # 动态导入模块
-                module = importlib.import_module(tool.module)
-                # 获取类
-                tool_class = getattr(module, tool.class_name)
+                # 首次启动时动态导入模块并获取类，之后直接使用缓存的类
+                if tool.resolved_class is None:
+                    module = importlib.import_module(tool.module)
+                    tool.resolved_class = getattr(module, tool.class_name)
                 # 创建实例
-                dialog = tool_class(self)
+                dialog = tool.resolved_class(self)
                 
                 # 检查对话框是否已被拒绝（密码验证失败或用户取消）
                 # 通过检查对话框的windowTitle是否被设置来判断初始化是否成功
                 if dialog.windowTitle():
                     # 使用show()而非exec()来创建非模态窗口
                     dialog.show()
-                    # 保存引用到列表中，防止被垃圾回收
-                    self.active_tool_dialogs.append(dialog)
-                    # 当对话框关闭时，从列表中移除
-                    dialog.destroyed.connect(lambda d=dialog: self.active_tool_dialogs.remove(d) if d in self.active_tool_dialogs else None)
+                    # 记录对话框的弱引用
+                    self.active_tool_dialogs[id(dialog)] = dialog
             else:
                 # 其他工具暂时显示提示
                 QMessageBox.information(self, "提示", f"{tool.name} - {tool.description}\n\n该功能正在开发中...")
@@ -245,6 +273,8 @@ class ToolBoxApp(QMainWindow):
 def main():
     # 创建应用实例
     app = QApplication(sys.argv)
+    # 退出时关闭数据库长连接
+    app.aboutToQuit.connect(db_manager.close)
     
     # 创建主窗口实例
     window = ToolBoxApp()
@@ -258,4 +288,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # 打包为可执行文件时，进程池的工作进程从这里进入
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
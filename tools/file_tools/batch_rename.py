@@ -1,5 +1,7 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit
+from .file_utils import append_log_lines, RENAME_WORKERS
 
 
 class BatchRenameDialog(QDialog):
@@ -9,12 +11,9 @@ class BatchRenameDialog(QDialog):
         self.parent = parent
         self.folder_path = ""  # 初始文件夹路径为空
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'BatchRenameDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         self.init_ui()
     
     def center_window(self):
@@ -95,12 +94,26 @@ class BatchRenameDialog(QDialog):
             # 遍历文件夹中的所有文件
             files_renamed = 0
             errors = 0
+            log_lines = []
             
-            for filename in os.listdir(self.folder_path):
-                file_path = os.path.join(self.folder_path, filename)
+            # 先取得目录项快照，避免重命名过程中迭代到新产生的文件名
+            # scandir返回的目录项自带文件类型信息，无需对每个文件单独stat
+            with os.scandir(self.folder_path) as it:
+                entries = list(it)
+            
+            # 目录中已有的名称集合，同名检查直接查集合，不再逐个调用os.path.exists
+            # 使用normcase，在不区分大小写的文件系统（Windows）上保持与exists一致的判断
+            # 原有名称在整个过程中都保留在集合中：重命名是并发执行的，
+            # 新名称不能占用其他文件尚未移走的旧名称，否则可能覆盖该文件
+            existing_names = {os.path.normcase(entry.name) for entry in entries}
+            
+            # 第一步：依次计算每个文件的新名称，得到(旧名称, 新名称)列表
+            rename_pairs = []
+            for entry in entries:
+                filename = entry.name
                 
                 # 跳过文件夹
-                if os.path.isdir(file_path):
+                if entry.is_dir():
                     continue
                 
                 try:
@@ -113,26 +126,44 @@ class BatchRenameDialog(QDialog):
                     if new_name != name:
                         # 构建新的完整文件名
                         new_filename = new_name + ext
-                        new_file_path = os.path.join(self.folder_path, new_filename)
                         
                         # 检查是否有同名文件
                         counter = 1
-                        while os.path.exists(new_file_path):
+                        while os.path.normcase(new_filename) in existing_names:
                             new_filename = f"{new_name}_{counter}{ext}"
-                            new_file_path = os.path.join(self.folder_path, new_filename)
                             counter += 1
                         
-                        # 执行重命名
-                        os.rename(file_path, new_file_path)
-                        self.log_edit.append(f"重命名: {filename} -> {new_filename}")
-                        files_renamed += 1
+                        existing_names.add(os.path.normcase(new_filename))
+                        rename_pairs.append((filename, new_filename))
                     else:
-                        self.log_edit.append(f"跳过: {filename} (无需更改)")
+                        log_lines.append(f"跳过: {filename} (无需更改)")
                 
                 except Exception as e:
-                    self.log_edit.append(f"错误: {filename} - {str(e)}")
+                    log_lines.append(f"错误: {filename} - {str(e)}")
+                    errors += 1
+            
+            # 第二步：并发执行重命名，重命名主要耗时在等待文件系统元数据写入，
+            # 多线程可以重叠这部分等待（网络驱动器上尤为明显）
+            with ThreadPoolExecutor(max_workers=RENAME_WORKERS) as pool:
+                futures = [
+                    pool.submit(os.rename,
+                                os.path.join(self.folder_path, filename),
+                                os.path.join(self.folder_path, new_filename))
+                    for filename, new_filename in rename_pairs
+                ]
+            
+            # 全部完成后按原顺序汇总结果
+            for (filename, new_filename), future in zip(rename_pairs, futures):
+                error = future.exception()
+                if error is None:
+                    log_lines.append(f"重命名: {filename} -> {new_filename}")
+                    files_renamed += 1
+                else:
+                    log_lines.append(f"错误: {filename} - {str(error)}")
                     errors += 1
             
+            append_log_lines(self.log_edit, log_lines)
+            
             # 完成消息
             self.log_edit.append(f"\n重命名完成！")
             self.log_edit.append(f"成功: {files_renamed} 个文件")
@@ -148,15 +179,13 @@ class BatchRenameDialog(QDialog):
         """应用重命名规则"""
         # 按照《测试》格式处理文件名
         
-        # 检查文件名是否已经包含书名号
-        if '《' in filename and '》' in filename:
-            # 提取书名号之间的内容
-            start_idx = filename.find('《')
-            end_idx = filename.find('》')
-            if start_idx < end_idx:
+        # 检查文件名是否已经包含书名号：先找第一个》，再只在它之前找第一个《
+        end_idx = filename.find('》')
+        if end_idx > 0:
+            start_idx = filename.find('《', 0, end_idx)
+            if start_idx != -1:
                 # 提取书名号及其中的内容
-                book_title = filename[start_idx:end_idx+1]
-                return book_title
+                return filename[start_idx:end_idx+1]
         
         # 简化处理：直接给整个文件名加上书名号
         return f"《{filename}》"
\ No newline at end of file
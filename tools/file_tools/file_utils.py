@@ -0,0 +1,333 @@
+"""
+文件处理工具公共方法
+"""
+import os
+import re
+import codecs
+import errno
+import fnmatch
+import shutil
+import tempfile
+from PyQt6.QtWidgets import QFileDialog
+
+# 并发读取文件的线程数，读文件主要是等待磁盘I/O
+MAX_READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 并发重命名文件的线程数，重命名主要是等待文件系统写入元数据，同一目录下线程过多时反而互相等待
+RENAME_WORKERS = 8
+
+# 写文件使用的缓冲区大小，小文件的几段内容可以合并为一次系统调用写入
+WRITE_BUFFER_SIZE = 1 << 17
+
+# 只按扩展名匹配的简单模式，如 *.txt
+_SIMPLE_EXT_PATTERN = re.compile(r'\*\.[A-Za-z0-9]+\Z')
+
+# 文件名是否不区分大小写（Windows），与fnmatch.fnmatch按os.path.normcase比较的行为一致
+_CASE_INSENSITIVE_NAMES = os.path.normcase('A') == 'a'
+
+# 文本处理工具默认跳过的文件大小上限
+MAX_TEXT_FILE_SIZE = 10 * 1024 * 1024
+
+# 超过该大小的文件使用内存映射读取，先在映射上做判断，不符合条件时无需复制文件内容
+MMAP_THRESHOLD = 256 * 1024
+
+# 判断是否为二进制文件时读取的文件开头字节数
+BINARY_CHECK_SIZE = 8192
+
+# 遍历子文件夹时跳过的文件夹（版本库、依赖和缓存目录），不进入其中查找文件
+SKIP_DIRS = frozenset({'.git', '.svn', '.hg', 'node_modules', '__pycache__', '.venv'})
+
+# 常见二进制文件扩展名，按扩展名直接跳过，无需打开文件
+_BINARY_EXTS = frozenset({
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.tif', '.tiff', '.psd',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz', '.tar', '.tgz',
+    '.exe', '.dll', '.so', '.dylib', '.lib', '.a', '.o', '.obj', '.bin', '.msi',
+    '.pyc', '.pyd', '.class', '.jar', '.whl',
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.mp3', '.wav', '.flac', '.ogg', '.mp4', '.avi', '.mkv', '.mov', '.wmv',
+    '.ttf', '.otf', '.woff', '.woff2', '.db', '.sqlite', '.iso', '.img',
+})
+
+
+def check_text_header(f):
+    """
+    读取文件开头的一小段，含有NUL字节或不是有效的UTF-8时视为二进制文件，抛出UnicodeDecodeError
+    调用方按解码失败的方式跳过该文件，无需读取整个文件；检查后读取位置回到文件开头
+    
+    Args:
+        f: 以二进制模式打开的文件对象
+    """
+    head = f.read(BINARY_CHECK_SIZE)
+    index = head.find(b'\x00')
+    if index != -1:
+        raise UnicodeDecodeError('utf-8', head, index, index + 1, "binary file")
+    # 文件之后都按UTF-8解码，开头不是有效的UTF-8时整个文件也无法解码
+    # 使用增量解码器，末尾被截断的多字节字符不算错误
+    codecs.getincrementaldecoder('utf-8')().decode(head)
+    f.seek(0)
+
+
+def read_text_file_bytes(file_path):
+    """
+    以二进制方式一次读取整个文件，调用方自行解码
+    不经过缓冲层，readall按文件大小一次分配并读取，避免分块读取和文本模式逐块解码的开销
+    文件开头含有NUL字节时视为二进制文件，抛出UnicodeDecodeError
+    """
+    with open(file_path, 'rb', buffering=0) as f:
+        check_text_header(f)
+        return f.readall()
+
+
+def atomic_write(file_path, chunks, buffering=WRITE_BUFFER_SIZE):
+    """
+    以原子方式写入文件：先写入同目录下的临时文件，再替换原文件
+    写入过程中出错时原文件保持不变，不会只写入一半内容
+
+    Args:
+        file_path: 目标文件路径
+        chunks: 依次写入的字节内容（bytes或memoryview）
+        buffering: 写入缓冲区大小
+    """
+    # 目标是符号链接时替换其指向的文件，保留链接本身
+    file_path = os.path.realpath(file_path)
+    dir_name, base_name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{base_name}.", suffix=".tmp", dir=dir_name)
+    try:
+        with open(fd, 'wb', buffering=buffering) as f:
+            for chunk in chunks:
+                f.write(chunk)
+        # 临时文件默认只有当前用户可读写，替换前复制原文件的权限
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def rename_no_replace(src, dst):
+    """
+    重命名文件，目标已存在时抛出FileExistsError，不会覆盖目标文件
+    检查和重命名在同一次系统调用中完成，无需事先调用os.path.exists
+
+    Args:
+        src: 原文件路径
+        dst: 新文件路径
+    """
+    if os.name == 'nt':
+        # Windows上os.rename在目标已存在时本身就会失败
+        os.rename(src, dst)
+        return
+    # POSIX上os.rename会直接覆盖目标，改为先创建硬链接（目标已存在时失败）再删除原路径
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError:
+        # 文件系统不支持硬链接时（如FAT、部分网络驱动器）退回到检查后重命名
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+        return
+    try:
+        os.unlink(src)
+    except OSError:
+        # 原路径删除失败时撤销新建的链接，保持重命名前的状态
+        os.unlink(dst)
+        raise
+
+
+def append_log_lines(log_edit, lines):
+    """
+    将循环中收集的多行日志一次性追加到日志框
+    逐行调用append时每个文件都会触发一次文本重排，文件较多时界面明显变慢
+
+    Args:
+        log_edit: 日志文本框
+        lines: 日志行列表，为空时不追加
+    """
+    if lines:
+        log_edit.append("\n".join(lines))
+
+
+class FolderFileToolMixin:
+    """
+    按文件夹批量处理文件的工具对话框公共方法
+    使用该类的对话框需要提供以下属性：folder_path、folder_path_edit、file_type_combo、
+    custom_type_edit、include_subfolders_check、log_edit
+    处理文本内容的对话框可将skip_binary_files设为True，遍历时跳过二进制扩展名和过大的文件
+    遍历子文件夹时跳过skip_dirs中的文件夹，设为空集合时遍历所有子文件夹
+    """
+    
+    skip_binary_files = False
+    max_file_size = MAX_TEXT_FILE_SIZE
+    skip_dirs = SKIP_DIRS
+    # 解析并编译后的文件匹配模式，文件类型或自定义模式变化时清空
+    _cached_file_patterns = None
+    
+    def center_window(self):
+        """将窗口设置在屏幕中央"""
+        # 获取屏幕可用几何区域
+        screen_geometry = self.screen().availableGeometry()
+        # 获取窗口大小
+        window_geometry = self.frameGeometry()
+        # 计算中心点
+        center_point = screen_geometry.center()
+        # 将窗口中心移动到屏幕中心
+        window_geometry.moveCenter(center_point)
+        # 应用位置
+        self.move(window_geometry.topLeft())
+    
+    def on_file_type_changed(self, text):
+        """文件类型变化时的处理"""
+        self.custom_type_edit.setEnabled(text == "自定义...")
+        self.invalidate_file_patterns()
+    
+    def invalidate_file_patterns(self, *args):
+        """文件类型或自定义模式变化时清空缓存的匹配模式，下次遍历时重新解析"""
+        self._cached_file_patterns = None
+    
+    def select_folder(self):
+        """选择文件夹"""
+        folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹", "")
+        if folder_path:
+            self.folder_path = folder_path
+            self.folder_path_edit.setText(folder_path)
+            self.log_edit.append(f"已选择文件夹: {folder_path}")
+    
+    def get_file_patterns(self):
+        """获取文件匹配模式"""
+        selected_type = self.file_type_combo.currentText()
+        if selected_type == "自定义...":
+            custom_pattern = self.custom_type_edit.text().strip()
+            if custom_pattern:
+                return [p.strip() for p in custom_pattern.split(';')]
+            else:
+                return ["*"]
+        elif selected_type == "所有文件 (*.*)":
+            return ["*"]
+        else:
+            # 从下拉选项中提取通配符
+            pattern_start = selected_type.find('(') + 1
+            pattern_end = selected_type.find(')')
+            if pattern_start > 0 and pattern_end > pattern_start:
+                pattern_text = selected_type[pattern_start:pattern_end]
+                return [p.strip() for p in pattern_text.split(';')]
+            return ["*"]
+    
+    def compile_file_patterns(self, patterns):
+        """
+        预处理通配符模式（支持 * 和 ?），每次处理只执行一次
+        
+        Returns:
+            (扩展名集合, 正则表达式): *.txt 这类只按扩展名匹配的模式放入集合，
+            其余模式合并编译为一个正则表达式，没有其余模式时为None；
+            在文件名不区分大小写的系统上，扩展名统一为小写，正则表达式忽略大小写
+        """
+        simple_exts = set()
+        complex_patterns = []
+        for pattern in patterns:
+            if _SIMPLE_EXT_PATTERN.match(pattern):
+                ext = pattern[2:]
+                simple_exts.add(ext.lower() if _CASE_INSENSITIVE_NAMES else ext)
+            else:
+                complex_patterns.append(fnmatch.translate(pattern))
+        flags = re.IGNORECASE if _CASE_INSENSITIVE_NAMES else 0
+        compiled = re.compile("|".join(complex_patterns), flags) if complex_patterns else None
+        return simple_exts, compiled
+    
+    def get_compiled_file_patterns(self):
+        """
+        获取当前文件类型对应的已编译匹配模式，只在文件类型或自定义模式变化后重新解析
+        
+        Returns:
+            模式中包含 * 时返回None（所有文件都匹配），否则返回compile_file_patterns的结果
+        """
+        if self._cached_file_patterns is None:
+            file_patterns = self.get_file_patterns()
+            # 模式中包含 * 时所有文件都匹配，无需逐个文件做模式匹配
+            compiled = None if "*" in file_patterns else self.compile_file_patterns(file_patterns)
+            self._cached_file_patterns = (compiled,)
+        return self._cached_file_patterns[0]
+    
+    def matches_file_pattern(self, filename, compiled_patterns):
+        """检查文件是否匹配任一模式"""
+        simple_exts, compiled = compiled_patterns
+        # 先比较扩展名，只有复杂的模式才需要正则匹配
+        _, dot, ext = filename.rpartition('.')
+        if _CASE_INSENSITIVE_NAMES:
+            ext = ext.lower()
+        if dot and ext in simple_exts:
+            return True
+        return compiled is not None and compiled.match(filename) is not None
+    
+    def get_files_to_process(self):
+        """获取要处理的文件列表"""
+        if not self.folder_path:
+            return []
+        
+        files_to_process = []
+        skipped_files = 0
+        skip_binary_files = self.skip_binary_files
+        skip_dirs = self.skip_dirs
+        compiled_patterns = self.get_compiled_file_patterns()
+        match_all = compiled_patterns is None
+        # 遍历中对每个文件调用的方法先取到局部变量
+        matches_file_pattern = self.matches_file_pattern
+        should_skip_file = self.should_skip_file
+        
+        try:
+            include_subfolders = self.include_subfolders_check.isChecked()
+            # 使用scandir遍历，目录项自带文件类型信息，无需对每个文件单独stat
+            # 用栈代替递归遍历子文件夹，与os.walk一样不进入符号链接指向的文件夹
+            dirs_to_scan = [self.folder_path]
+            while dirs_to_scan:
+                current_dir = dirs_to_scan.pop()
+                try:
+                    with os.scandir(current_dir) as it:
+                        entries = list(it)
+                except OSError:
+                    # 无法访问的子文件夹直接跳过
+                    continue
+                
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir():
+                        # 遍历子文件夹，整个跳过版本库、依赖和缓存目录
+                        if include_subfolders and entry.name not in skip_dirs and not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and (match_all or matches_file_pattern(entry.name, compiled_patterns)):
+                        if skip_binary_files and should_skip_file(entry):
+                            skipped_files += 1
+                        else:
+                            files_to_process.append(entry.path)
+                
+                # 逆序入栈，保证子文件夹按目录顺序处理
+                dirs_to_scan.extend(reversed(subdirs))
+        except Exception as e:
+            self.log_edit.append(f"获取文件列表时出错: {str(e)}")
+        
+        if skipped_files:
+            self.log_edit.append(f"已跳过 {skipped_files} 个二进制或超过 {self.max_file_size // (1024 * 1024)} MB 的文件")
+        
+        return files_to_process
+    
+    def should_skip_file(self, entry):
+        """按扩展名和文件大小判断是否跳过该文件，只使用目录项信息，不打开文件"""
+        if os.path.splitext(entry.name)[1].lower() in _BINARY_EXTS:
+            return True
+        try:
+            return entry.stat().st_size > self.max_file_size
+        except OSError:
+            # 无法获取大小时交给后续读取时处理
+            return False
+    
+    def get_rel_path(self, file_path):
+        """获取文件相对于所选文件夹的路径，直接截取前缀，不在该文件夹下时使用文件名"""
+        base = os.path.join(self.folder_path, '')
+        if file_path.startswith(base):
+            return file_path[len(base):]
+        return os.path.basename(file_path)
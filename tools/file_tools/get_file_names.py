@@ -1,5 +1,6 @@
 import os
 from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox
+from .file_utils import append_log_lines
 
 
 class GetFileNamesDialog(QDialog):
@@ -11,12 +12,9 @@ class GetFileNamesDialog(QDialog):
         self.file_names = []
         self.file_names_without_ext = []  # 存储不含后缀的文件名
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'GetFileNamesDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         self.init_ui()
     
     def center_window(self):
@@ -119,24 +117,28 @@ class GetFileNamesDialog(QDialog):
             
             # 遍历文件夹中的所有文件
             file_count = 0
+            log_lines = []
             
-            for filename in os.listdir(self.folder_path):
-                file_path = os.path.join(self.folder_path, filename)
-                
-                # 只处理文件，跳过文件夹
-                if os.path.isfile(file_path):
-                    self.file_names.append(filename)
-                    
-                    # 根据选项决定显示和存储的文件名
-                    if remove_ext:
-                        name_without_ext, _ = os.path.splitext(filename)
-                        self.file_names_without_ext.append(name_without_ext)
-                        self.log_edit.append(name_without_ext)
-                    else:
-                        self.file_names_without_ext.append(filename)
-                        self.log_edit.append(filename)
-                    
-                    file_count += 1
+            # scandir返回的目录项自带文件类型信息，无需对每个文件单独stat
+            with os.scandir(self.folder_path) as it:
+                for entry in it:
+                    # 只处理文件，跳过文件夹
+                    if entry.is_file():
+                        filename = entry.name
+                        self.file_names.append(filename)
+                        
+                        # 根据选项决定显示和存储的文件名
+                        if remove_ext:
+                            name_without_ext, _ = os.path.splitext(filename)
+                            self.file_names_without_ext.append(name_without_ext)
+                            log_lines.append(name_without_ext)
+                        else:
+                            self.file_names_without_ext.append(filename)
+                            log_lines.append(filename)
+                        
+                        file_count += 1
+            
+            append_log_lines(self.log_edit, log_lines)
             
             # 完成消息
             self.log_edit.append(f"\n获取完成！共找到 {file_count} 个文件")
@@ -166,8 +168,8 @@ class GetFileNamesDialog(QDialog):
                 
                 # 写入文件，根据之前获取时的选项状态决定使用哪个列表
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    for filename in self.file_names_without_ext:
-                        f.write(f"{filename}\n")
+                    # 拼接成一个字符串后一次写入
+                    f.write("\n".join(self.file_names_without_ext) + "\n")
                 
                 self.log_edit.append(f"\n已成功导出到: {file_path}")
                 QMessageBox.information(self, "成功", f"文件名列表已成功导出到:\n{file_path}")
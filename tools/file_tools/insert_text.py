@@ -1,37 +1,27 @@
 import os
-import re
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
 from PyQt6.QtCore import Qt
 
+from .file_utils import FolderFileToolMixin, atomic_write, check_text_header, MAX_READ_WORKERS, append_log_lines
 
-class InsertTextDialog(QDialog):
+
+class InsertTextDialog(FolderFileToolMixin, QDialog):
     """在文件夹内的文件中的特定行插入一行指定文本工具对话框"""
+    skip_binary_files = True
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
         self.folder_path = ""  # 初始文件夹路径为空
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if hasattr(tool, 'class_name') and tool.class_name == 'InsertTextDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         self.init_ui()
     
-    def center_window(self):
-        """将窗口设置在屏幕中央"""
-        # 获取屏幕可用几何区域
-        screen_geometry = self.screen().availableGeometry()
-        # 获取窗口大小
-        window_geometry = self.frameGeometry()
-        # 计算中心点
-        center_point = screen_geometry.center()
-        # 将窗口中心移动到屏幕中心
-        window_geometry.moveCenter(center_point)
-        # 应用位置
-        self.move(window_geometry.topLeft())
-    
     def init_ui(self):
         # 设置窗口属性
         # 如果未在构造函数中设置窗口标题，则使用默认标题
@@ -64,6 +54,7 @@ class InsertTextDialog(QDialog):
         self.custom_type_edit.setPlaceholderText("例如: *.txt;*.md")
         self.custom_type_edit.setEnabled(False)
         self.file_type_combo.currentTextChanged.connect(self.on_file_type_changed)
+        self.custom_type_edit.textChanged.connect(self.invalidate_file_patterns)
         
         file_type_layout.addWidget(file_type_label)
         file_type_layout.addWidget(self.file_type_combo)
@@ -122,74 +113,6 @@ class InsertTextDialog(QDialog):
         # 将窗口设置在屏幕中央
         self.center_window()
     
-    def on_file_type_changed(self, text):
-        """文件类型变化时的处理"""
-        self.custom_type_edit.setEnabled(text == "自定义...")
-    
-    def select_folder(self):
-        """选择文件夹"""
-        folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹", "")
-        if folder_path:
-            self.folder_path = folder_path
-            self.folder_path_edit.setText(folder_path)
-            self.log_edit.append(f"已选择文件夹: {folder_path}")
-    
-    def get_file_patterns(self):
-        """获取文件匹配模式"""
-        selected_type = self.file_type_combo.currentText()
-        if selected_type == "自定义...":
-            custom_pattern = self.custom_type_edit.text().strip()
-            if custom_pattern:
-                return [p.strip() for p in custom_pattern.split(';')]
-            else:
-                return ["*"]
-        elif selected_type == "所有文件 (*.*)":
-            return ["*"]
-        else:
-            # 从下拉选项中提取通配符
-            pattern_start = selected_type.find('(') + 1
-            pattern_end = selected_type.find(')')
-            if pattern_start > 0 and pattern_end > pattern_start:
-                pattern_text = selected_type[pattern_start:pattern_end]
-                return [p.strip() for p in pattern_text.split(';')]
-            return ["*"]
-    
-    def matches_file_pattern(self, filename, patterns):
-        """检查文件是否匹配任一模式"""
-        for pattern in patterns:
-            # 简单的通配符匹配
-            # 将 * 转换为 .* 用于正则匹配
-            regex_pattern = pattern.replace('.', '\\.').replace('*', '.*')
-            if re.match(f"^{regex_pattern}$", filename):
-                return True
-        return False
-    
-    def get_files_to_process(self):
-        """获取要处理的文件列表"""
-        if not self.folder_path:
-            return []
-        
-        files_to_process = []
-        file_patterns = self.get_file_patterns()
-        
-        try:
-            if self.include_subfolders_check.isChecked():
-                # 遍历所有子文件夹
-                for root, _, files in os.walk(self.folder_path):
-                    for filename in files:
-                        if self.matches_file_pattern(filename, file_patterns):
-                            files_to_process.append(os.path.join(root, filename))
-            else:
-                # 只处理当前文件夹
-                for filename in os.listdir(self.folder_path):
-                    file_path = os.path.join(self.folder_path, filename)
-                    if os.path.isfile(file_path) and self.matches_file_pattern(filename, file_patterns):
-                        files_to_process.append(file_path)
-        except Exception as e:
-            self.log_edit.append(f"获取文件列表时出错: {str(e)}")
-        
-        return files_to_process
-    
     def parse_position(self, position_str):
         """解析插入位置"""
         try:
@@ -199,6 +122,42 @@ class InsertTextDialog(QDialog):
             QMessageBox.warning(self, "警告", "插入位置必须是整数！")
             return None
     
+    def read_preview_window(self, file_path, position):
+        """
+        读取插入位置附近的几行用于预览，不把整个文件读入内存
+        
+        Returns:
+            (实际插入位置, 预览窗口起始行号, 预览窗口中的行, 已读取的行数, 文件修改时间)
+            正数位置只读取到插入位置后3行为止；负数位置需要统计总行数，只保留文件末尾的几行
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            # 先检查文件开头，二进制文件不再逐行解码
+            check_text_header(f.buffer)
+            # 记录预览时的修改时间，插入前据此判断文件是否已被改动
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            if position >= 0:
+                head = list(itertools.islice(f, position + 3))
+                line_count = len(head)
+                actual_position = min(position, line_count)
+                window_start = max(0, actual_position - 2)
+                return actual_position, window_start, head[window_start:actual_position + 3], line_count, mtime_ns
+            
+            tail = deque(maxlen=2 - position)
+            line_count = 0
+            for line in f:
+                tail.append(line)
+                line_count += 1
+        
+        # -1表示插入到文件末尾，其他负数从末尾倒数
+        if position == -1:
+            actual_position = line_count
+        else:
+            actual_position = max(0, line_count + position)
+        window_start = max(0, actual_position - 2)
+        tail_start = line_count - len(tail)
+        window = list(tail)[window_start - tail_start:actual_position + 3 - tail_start]
+        return actual_position, window_start, window, line_count, mtime_ns
+    
     def preview_insert(self):
         """预览插入操作"""
         # 验证输入
@@ -224,50 +183,50 @@ class InsertTextDialog(QDialog):
         
         valid_files = 0
         
-        for file_path in files_to_process:
+        # 使用线程池并发读取文件，结果仍按文件顺序在主线程中输出日志
+        with ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as pool:
+            futures = [pool.submit(self.read_preview_window, file_path, position) for file_path in files_to_process]
+        
+        # 对于多行文本，在预览中显示第一行和行数信息
+        insert_lines = insert_text.split('\n')
+        preview_text = insert_lines[0]
+        if len(insert_lines) > 1:
+            preview_text += f"... (共{len(insert_lines)}行)"
+        
+        log_lines = []
+        
+        for file_path, future in zip(files_to_process, futures):
+            # 每个文件只计算一次相对路径，用于输出日志
+            rel_path = self.get_rel_path(file_path)
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                # 计算实际插入位置
-                if position == -1:
-                    actual_position = len(lines)
-                elif position < 0:
-                    actual_position = max(0, len(lines) + position)
-                else:
-                    actual_position = min(position, len(lines))
+                # 计算实际插入位置，只读取预览需要的几行
+                actual_position, start_line, window, line_count, mtime_ns = future.result()
                 
                 valid_files += 1
-                self.preview_files.append((file_path, lines, actual_position))
+                self.preview_files.append((file_path, actual_position, mtime_ns))
                 
                 # 显示预览信息
-                rel_path = os.path.relpath(file_path, self.folder_path)
-                self.log_edit.append(f"将在 {rel_path} 的第 {actual_position} 行前插入文本（插入位置在插入内容前面）")
+                log_lines.append(f"将在 {rel_path} 的第 {actual_position} 行前插入文本（插入位置在插入内容前面）")
                 
                 # 显示部分文件内容作为预览
-                start_line = max(0, actual_position - 2)
-                end_line = min(len(lines), actual_position + 3)
-                
-                # 对于多行文本，在预览中显示第一行和行数信息
-                insert_lines = insert_text.split('\n')
-                preview_text = insert_lines[0]
-                if len(insert_lines) > 1:
-                    preview_text += f"... (共{len(insert_lines)}行)"
+                end_line = min(line_count, actual_position + 3)
                 
                 for i in range(start_line, end_line):
                     if i == actual_position:
-                        self.log_edit.append(f"  > 【将在此处插入】 {preview_text}")
+                        log_lines.append(f"  > 【将在此处插入】 {preview_text}")
                     else:
-                        self.log_edit.append(f"  {i}: {lines[i].rstrip()}")
-                if end_line == len(lines) and actual_position == len(lines):
-                    self.log_edit.append(f"  > 【将在此处插入】 {preview_text}")
+                        log_lines.append(f"  {i}: {window[i - start_line].rstrip()}")
+                if end_line == line_count and actual_position == line_count:
+                    log_lines.append(f"  > 【将在此处插入】 {preview_text}")
                 
-                self.log_edit.append("---------------")
+                log_lines.append("---------------")
             
             except UnicodeDecodeError:
-                self.log_edit.append(f"跳过二进制文件: {os.path.relpath(file_path, self.folder_path)}")
+                log_lines.append(f"跳过二进制文件: {rel_path}")
             except Exception as e:
-                self.log_edit.append(f"读取文件 {os.path.relpath(file_path, self.folder_path)} 时出错: {str(e)}")
+                log_lines.append(f"读取文件 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         self.log_edit.append(f"\n预览完成！")
         self.log_edit.append(f"将对 {valid_files} 个文件执行插入操作")
@@ -321,34 +280,53 @@ class InsertTextDialog(QDialog):
         if not insert_text.endswith('\n'):
             insert_text += '\n'
         
-        for file_path, lines, actual_position in self.preview_files:
+        log_lines = []
+        
+        for file_path, actual_position, mtime_ns in self.preview_files:
+            rel_path = self.get_rel_path(file_path)
             try:
-                # 执行插入
-                new_lines = lines.copy()
-                new_lines.insert(actual_position, insert_text)
+                # 预览之后文件被修改过（包括已经执行过插入），插入位置可能已经不对，跳过该文件
+                if os.stat(file_path).st_mtime_ns != mtime_ns:
+                    log_lines.append(f"跳过: {rel_path} 在预览后已被修改，请重新预览")
+                    continue
+                
+                # 预览时只记录了插入位置，这里按字节重新读取文件内容
+                with open(file_path, 'rb', buffering=0) as f:
+                    data = f.readall()
+                # 确认文件是UTF-8文本，非文本文件解码失败时作为错误处理
+                data.decode('utf-8')
+                
+                # 沿用文件原有的换行符风格，只有 \r 换行的文件按 \r 分行
+                if b'\n' not in data and b'\r' in data:
+                    line_end, newline = b'\r', '\r'
+                else:
+                    line_end, newline = b'\n', '\r\n' if b'\r\n' in data else '\n'
                 
-                # 写入新内容
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(new_lines)
+                # 找到第actual_position行的起始位置，行数不足时插入到文件末尾
+                offset = 0
+                for _ in range(actual_position):
+                    index = data.find(line_end, offset)
+                    if index == -1:
+                        offset = len(data)
+                        break
+                    offset = index + 1
+                
+                # 执行插入：直接在字节层面拼接，无需拆分成行列表
+                insert_bytes = insert_text.replace('\n', newline).encode('utf-8')
+                
+                # 写入新内容：分段写入缓冲区，避免拼接出整个文件的副本
+                # 先写临时文件再替换原文件，写入失败时原文件不受影响
+                view = memoryview(data)
+                atomic_write(file_path, (view[:offset], insert_bytes, view[offset:]))
                 
                 files_changed += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"已在 {rel_path} 的第 {actual_position} 行前插入文本（插入位置在插入内容前面）")
+                log_lines.append(f"已在 {rel_path} 的第 {actual_position} 行前插入文本（插入位置在插入内容前面）")
                 
             except Exception as e:
                 errors += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"插入 {rel_path} 时出错: {str(e)}")
+                log_lines.append(f"插入 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         # 完成消息
         self.log_edit.append(f"\n插入完成！")
@@ -1,37 +1,128 @@
 import os
 import re
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
+import mmap
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
 from PyQt6.QtCore import Qt
 
+from .file_utils import FolderFileToolMixin, atomic_write, check_text_header, MMAP_THRESHOLD, MAX_READ_WORKERS, append_log_lines
 
-class RemoveExtraNewlinesDialog(QDialog):
+
+# 直接按字节处理文件内容，无需UTF-8解码和编码，文件的换行符风格（\n、\r\n、\r）保持不变
+# 空白字符包括ASCII空白和Unicode空白字符的UTF-8编码（与str的 \s 一致），不含换行符
+_SPACE_BYTES = rb'[\t\x0b\x0c\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80'
+# 换行符：\r\n 作为一个整体，单独的 \r 也视为换行（与文本模式读取一致）
+_NEWLINE_BYTES = rb'\r\n|\r(?!\n)|\n'
+
+# 文件开头的所有空白字符和空行
+_LEADING_WS_PATTERN = re.compile(rb'(?:[\r\n]|' + _SPACE_BYTES + rb')+')
+# 连续多个空行（中间可夹杂空白字符）：一个换行符后面至少还有两个只含空白字符的换行
+# 用于含有单独 \r 换行的内容，其余情况按行扫描处理
+_EXTRA_NEWLINES_PATTERN = re.compile(
+    rb'(' + _NEWLINE_BYTES + rb')(?:(?:' + _SPACE_BYTES + rb')*(?:' + _NEWLINE_BYTES + rb')){2,}'
+)
+# 只含空白字符的行（已去掉两端ASCII空白后判断）
+_SPACE_ONLY_PATTERN = re.compile(rb'(?:' + _SPACE_BYTES + rb')*')
+
+
+def _is_blank_line(line):
+    """判断一行（不含末尾的 \n）是否只包含空白字符"""
+    stripped = line.strip()
+    if not stripped:
+        return True
+    # 去掉ASCII空白后以普通ASCII字符开头的行一定不是空白行，无需正则判断
+    first = stripped[0]
+    if first < 0x80 and not 0x1c <= first <= 0x1f:
+        return False
+    return _SPACE_ONLY_PATTERN.fullmatch(stripped) is not None
+
+
+def _collapse_blank_lines(content):
+    """
+    按行扫描，将两个及以上连续的空白行合并为一个空行，结果与_EXTRA_NEWLINES_PATTERN替换一致
+    只适用于以 \n 或 \r\n 换行、且开头不是空白行的内容
+    """
+    lines = content.split(b'\n')
+    result = []
+    blank_lines = []  # 当前连续的空白行
+    # 最后一段之后没有换行符，不能算作空白行
+    for line in itertools.islice(lines, len(lines) - 1):
+        if _is_blank_line(line):
+            blank_lines.append(line)
+            continue
+        if len(blank_lines) >= 2:
+            # 合并为一个空行，沿用上一行的换行符风格（\r\n 时行尾带有 \r）
+            result.append(b'\r' if result[-1].endswith(b'\r') else b'')
+        else:
+            result.extend(blank_lines)
+        blank_lines.clear()
+        result.append(line)
+    
+    if len(blank_lines) >= 2:
+        result.append(b'\r' if result[-1].endswith(b'\r') else b'')
+    else:
+        result.extend(blank_lines)
+    result.append(lines[-1])
+    return b'\n'.join(result)
+
+
+def remove_extra_newlines(content):
+    """删除多余空行，保留至多一个空行，并确保文件开头不是空行（content为文件的原始字节）"""
+    # 1. 首先移除文件开头的所有空行和空白字符
+    leading = _LEADING_WS_PATTERN.match(content)
+    modified_content = content[leading.end():] if leading else content
+    
+    # 2. 然后将多个连续的换行符替换为单个换行符
+    # 注意：这里需要保留单个空行，所以将两个或多个连续换行符替换为两个换行符
+    # 这样就保留了至多一个空行，替换时沿用匹配到的第一个换行符的风格
+    # 没有单独 \r 换行时按行扫描，比逐字节尝试正则匹配快；否则使用正则替换
+    if modified_content.count(b'\r') == modified_content.count(b'\r\n'):
+        modified_content = _collapse_blank_lines(modified_content)
+    else:
+        modified_content = _EXTRA_NEWLINES_PATTERN.sub(rb'\1\1', modified_content)
+    
+    return modified_content
+
+
+def _read_and_process_file(file_path):
+    """读取文件并删除多余空行，返回(原内容, 修改后内容)，文件无需修改时返回None，在线程池中执行"""
+    # 不经过缓冲层，小文件一次readall读入
+    with open(file_path, 'rb', buffering=0) as f:
+        # 先检查文件开头，二进制文件不读取全部内容
+        check_text_header(f)
+        if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # 开头没有空白字符、也没有连续空行的文件一定无需修改，正则直接在映射的页面上匹配
+                if not _LEADING_WS_PATTERN.match(mm) and not _EXTRA_NEWLINES_PATTERN.search(mm):
+                    return None
+                original_content = mm[:]
+        else:
+            original_content = f.readall()
+    
+    modified_content = remove_extra_newlines(original_content)
+    if modified_content == original_content:
+        return None
+    
+    # 只对需要修改的文件检查是否为UTF-8文本，非文本文件解码失败会作为二进制文件跳过
+    original_content.decode('utf-8')
+    return original_content, modified_content
+
+
+class RemoveExtraNewlinesDialog(FolderFileToolMixin, QDialog):
     """删除多余空行工具对话框"""
+    skip_binary_files = True
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
         self.folder_path = ""  # 初始文件夹路径为空
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'RemoveExtraNewlinesDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         self.init_ui()
     
-    def center_window(self):
-        """将窗口设置在屏幕中央"""
-        # 获取屏幕可用几何区域
-        screen_geometry = self.screen().availableGeometry()
-        # 获取窗口大小
-        window_geometry = self.frameGeometry()
-        # 计算中心点
-        center_point = screen_geometry.center()
-        # 将窗口中心移动到屏幕中心
-        window_geometry.moveCenter(center_point)
-        # 应用位置
-        self.move(window_geometry.topLeft())
-    
     def init_ui(self):
         # 设置窗口属性
         # 如果未在构造函数中设置窗口标题，则使用默认标题
@@ -64,6 +155,7 @@ class RemoveExtraNewlinesDialog(QDialog):
         self.custom_type_edit.setPlaceholderText("例如: *.txt;*.md")
         self.custom_type_edit.setEnabled(False)
         self.file_type_combo.currentTextChanged.connect(self.on_file_type_changed)
+        self.custom_type_edit.textChanged.connect(self.invalidate_file_patterns)
         
         file_type_layout.addWidget(file_type_label)
         file_type_layout.addWidget(self.file_type_combo)
@@ -106,84 +198,10 @@ class RemoveExtraNewlinesDialog(QDialog):
         # 将窗口设置在屏幕中央
         self.center_window()
     
-    def on_file_type_changed(self, text):
-        """文件类型变化时的处理"""
-        self.custom_type_edit.setEnabled(text == "自定义...")
-    
-    def select_folder(self):
-        """选择文件夹"""
-        folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹", "")
-        if folder_path:
-            self.folder_path = folder_path
-            self.folder_path_edit.setText(folder_path)
-            self.log_edit.append(f"已选择文件夹: {folder_path}")
-    
-    def get_file_patterns(self):
-        """获取文件匹配模式"""
-        selected_type = self.file_type_combo.currentText()
-        if selected_type == "自定义...":
-            custom_pattern = self.custom_type_edit.text().strip()
-            if custom_pattern:
-                return [p.strip() for p in custom_pattern.split(';')]
-            else:
-                return ["*"]
-        elif selected_type == "所有文件 (*.*)":
-            return ["*"]
-        else:
-            # 从下拉选项中提取通配符
-            pattern_start = selected_type.find('(') + 1
-            pattern_end = selected_type.find(')')
-            if pattern_start > 0 and pattern_end > pattern_start:
-                pattern_text = selected_type[pattern_start:pattern_end]
-                return [p.strip() for p in pattern_text.split(';')]
-            return ["*"]
-    
-    def matches_file_pattern(self, filename, patterns):
-        """检查文件是否匹配任一模式"""
-        for pattern in patterns:
-            # 简单的通配符匹配
-            regex_pattern = pattern.replace('.', '\\.').replace('*', '.*')
-            if re.match(f"^{regex_pattern}$", filename):
-                return True
-        return False
-    
-    def get_files_to_process(self):
-        """获取要处理的文件列表"""
-        if not self.folder_path:
-            return []
-        
-        files_to_process = []
-        file_patterns = self.get_file_patterns()
-        
-        try:
-            if self.include_subfolders_check.isChecked():
-                # 遍历所有子文件夹
-                for root, _, files in os.walk(self.folder_path):
-                    for filename in files:
-                        if self.matches_file_pattern(filename, file_patterns):
-                            files_to_process.append(os.path.join(root, filename))
-            else:
-                # 只处理当前文件夹
-                for filename in os.listdir(self.folder_path):
-                    file_path = os.path.join(self.folder_path, filename)
-                    if os.path.isfile(file_path) and self.matches_file_pattern(filename, file_patterns):
-                        files_to_process.append(file_path)
-        except Exception as e:
-            self.log_edit.append(f"获取文件列表时出错: {str(e)}")
-        
-        return files_to_process
-    
-    def remove_extra_newlines(self, content):
+    @staticmethod
+    def remove_extra_newlines(content):
         """删除多余空行，保留至多一个空行，并确保文件开头不是空行"""
-        # 1. 首先移除文件开头的所有空行和空白字符
-        modified_content = re.sub(r'^[\s\n]+', '', content)
-        
-        # 2. 然后将多个连续的换行符替换为单个换行符
-        # 注意：这里需要保留单个空行，所以将两个或多个连续换行符替换为两个换行符
-        # 这样就保留了至多一个空行
-        modified_content = re.sub(r'\n\s*\n\s*\n+', '\n\n', modified_content)
-        
-        return modified_content
+        return remove_extra_newlines(content)
     
     def preview_remove(self):
         """预览处理结果"""
@@ -201,56 +219,40 @@ class RemoveExtraNewlinesDialog(QDialog):
         
         files_with_extra_newlines = 0
         
-        for file_path in files_to_process:
+        # 使用线程池并发读取和处理文件，结果仍按文件顺序在主线程中输出日志
+        with ThreadPoolExecutor(max_workers=MAX_READ_WORKERS) as pool:
+            futures = [pool.submit(_read_and_process_file, file_path) for file_path in files_to_process]
+        
+        log_lines = []
+        
+        for file_path, future in zip(files_to_process, futures):
+            # 每个文件只计算一次相对路径，用于输出日志
+            rel_path = self.get_rel_path(file_path)
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    original_content = f.read()
-                
-                # 执行删除多余空行的操作
-                modified_content = self.remove_extra_newlines(original_content)
+                # 读取文件并执行删除多余空行的操作，文件无变化时结果为None
+                result = future.result()
                 
                 # 检查文件是否有变化
-                if modified_content != original_content:
+                if result is not None:
+                    original_content, modified_content = result
                     files_with_extra_newlines += 1
                     self.preview_results.append((file_path, original_content, modified_content))
                     
-                    # 计算空行变化
-                    original_empty_lines = original_content.count('\n\n')
-                    modified_empty_lines = modified_content.count('\n\n')
+                    # 计算空行变化（统一换行符后再统计）
+                    original_empty_lines = original_content.replace(b'\r\n', b'\n').replace(b'\r', b'\n').count(b'\n\n')
+                    modified_empty_lines = modified_content.replace(b'\r\n', b'\n').replace(b'\r', b'\n').count(b'\n\n')
                     
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    self.log_edit.append(f"文件 {rel_path} 中存在多余空行")
-                    self.log_edit.append(f"  原连续空行数: {original_empty_lines}, 修改后连续空行数: {modified_empty_lines}")
+                    log_lines.append(f"文件 {rel_path} 中存在多余空行")
+                    log_lines.append(f"  原连续空行数: {original_empty_lines}, 修改后连续空行数: {modified_empty_lines}")
                 else:
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    self.log_edit.append(f"文件 {rel_path} 无需修改")
+                    log_lines.append(f"文件 {rel_path} 无需修改")
             
             except UnicodeDecodeError:
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"跳过二进制文件: {rel_path}")
+                log_lines.append(f"跳过二进制文件: {rel_path}")
             except Exception as e:
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"处理文件 {rel_path} 时出错: {str(e)}")
+                log_lines.append(f"处理文件 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         self.log_edit.append(f"\n预览完成！")
         self.log_edit.append(f"需要处理: {files_with_extra_newlines} 个文件")
@@ -291,30 +293,23 @@ class RemoveExtraNewlinesDialog(QDialog):
         files_processed = 0
         errors = 0
         
+        log_lines = []
+        
         for file_path, _, modified_content in self.preview_results:
+            rel_path = self.get_rel_path(file_path)
             try:
                 # 写入新内容
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(modified_content)
+                # 先写临时文件再替换原文件，写入失败时原文件不受影响
+                atomic_write(file_path, (modified_content,))
                 
                 files_processed += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"已处理: {rel_path}")
+                log_lines.append(f"已处理: {rel_path}")
                 
             except Exception as e:
                 errors += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"处理 {rel_path} 时出错: {str(e)}")
+                log_lines.append(f"处理 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         # 完成消息
         self.log_edit.append(f"\n处理完成！")
@@ -1,10 +1,12 @@
 import os
 import re
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox
 from PyQt6.QtCore import Qt
 
+from .file_utils import FolderFileToolMixin, rename_no_replace, append_log_lines
 
-class ReplaceInFilenamesDialog(QDialog):
+
+class ReplaceInFilenamesDialog(FolderFileToolMixin, QDialog):
     """替换文件名中字符工具对话框"""
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -12,27 +14,11 @@ class ReplaceInFilenamesDialog(QDialog):
         self.folder_path = ""  # 初始文件夹路径为空
         self.preview_results = []  # 存储预览结果 (原文件路径, 新文件名)
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'ReplaceInFilenamesDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         self.init_ui()
     
-    def center_window(self):
-        """将窗口设置在屏幕中央"""
-        # 获取屏幕可用几何区域
-        screen_geometry = self.screen().availableGeometry()
-        # 获取窗口大小
-        window_geometry = self.frameGeometry()
-        # 计算中心点
-        center_point = screen_geometry.center()
-        # 将窗口中心移动到屏幕中心
-        window_geometry.moveCenter(center_point)
-        # 应用位置
-        self.move(window_geometry.topLeft())
-    
     def init_ui(self):
         # 设置窗口属性
         # 如果未在构造函数中设置窗口标题，则使用默认标题
@@ -91,6 +77,7 @@ class ReplaceInFilenamesDialog(QDialog):
         self.custom_type_edit.setPlaceholderText("例如: *.txt;*.md")
         self.custom_type_edit.setEnabled(False)
         self.file_type_combo.currentTextChanged.connect(self.on_file_type_changed)
+        self.custom_type_edit.textChanged.connect(self.invalidate_file_patterns)
         
         file_type_layout.addWidget(file_type_label)
         file_type_layout.addWidget(self.file_type_combo)
@@ -135,84 +122,41 @@ class ReplaceInFilenamesDialog(QDialog):
         # 将窗口设置在屏幕中央
         self.center_window()
     
-    def on_file_type_changed(self, text):
-        """文件类型变化时的处理"""
-        self.custom_type_edit.setEnabled(text == "自定义...")
-    
-    def select_folder(self):
-        """选择文件夹"""
-        folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹", "")
-        if folder_path:
-            self.folder_path = folder_path
-            self.folder_path_edit.setText(folder_path)
-            self.log_edit.append(f"已选择文件夹: {folder_path}")
-    
-    def get_file_patterns(self):
-        """获取文件匹配模式"""
-        selected_type = self.file_type_combo.currentText()
-        if selected_type == "自定义...":
-            custom_pattern = self.custom_type_edit.text().strip()
-            if custom_pattern:
-                return [p.strip() for p in custom_pattern.split(';')]
-            else:
-                return ["*"]
-        elif selected_type == "所有文件 (*.*)":
-            return ["*"]
-        else:
-            # 从下拉选项中提取通配符
-            pattern_start = selected_type.find('(') + 1
-            pattern_end = selected_type.find(')')
-            if pattern_start > 0 and pattern_end > pattern_start:
-                pattern_text = selected_type[pattern_start:pattern_end]
-                return [p.strip() for p in pattern_text.split(';')]
-            return ["*"]
-    
-    def matches_file_pattern(self, filename, patterns):
-        """检查文件是否匹配任一模式"""
-        for pattern in patterns:
-            # 简单的通配符匹配
-            regex_pattern = pattern.replace('.', '\\.').replace('*', '.*')
-            if re.match(f"^{regex_pattern}$", filename):
-                return True
-        return False
+    def build_name_filter(self, find_text, match_case):
+        """
+        返回快速判断文件名是否可能包含查找文本的函数，不包含的文件名无需进入替换逻辑
+        无法安全地按小写比较时（非ASCII文本，或含有 i、k、s，忽略大小写时还与İ、ı、K、ſ匹配）返回None
+        """
+        if match_case:
+            return lambda filename: find_text in filename
+        if not find_text.isascii() or any(c in 'iks' for c in find_text.lower()):
+            return None
+        find_lower = find_text.lower()
+        return lambda filename: find_lower in filename.lower()
     
-    def get_files_to_process(self):
-        """获取要处理的文件列表"""
-        if not self.folder_path:
-            return []
-        
-        files_to_process = []
-        file_patterns = self.get_file_patterns()
-        
-        try:
-            if self.include_subfolders_check.isChecked():
-                # 遍历所有子文件夹
-                for root, _, files in os.walk(self.folder_path):
-                    for filename in files:
-                        if self.matches_file_pattern(filename, file_patterns):
-                            files_to_process.append(os.path.join(root, filename))
-            else:
-                # 只处理当前文件夹
-                for filename in os.listdir(self.folder_path):
-                    file_path = os.path.join(self.folder_path, filename)
-                    if os.path.isfile(file_path) and self.matches_file_pattern(filename, file_patterns):
-                        files_to_process.append(file_path)
-        except Exception as e:
-            self.log_edit.append(f"获取文件列表时出错: {str(e)}")
-        
-        return files_to_process
+    def compile_find_pattern(self, find_text, match_case):
+        """
+        不区分大小写时把查找文本编译为正则表达式，每次预览只编译一次
+        区分大小写时返回None，直接使用字符串替换
+        """
+        if match_case:
+            return None
+        return re.compile(re.escape(find_text), re.IGNORECASE)
     
-    def get_new_filename(self, filename, find_text, replace_text, match_case=True):
-        """获取替换后的新文件名"""
+    def get_new_filename(self, filename, find_text, replace_text, pattern=None):
+        """
+        获取替换后的新文件名
+        
+        Args:
+            pattern: compile_find_pattern返回的正则表达式，为None时区分大小写直接替换
+        """
         if not find_text:
             return filename
         
-        if match_case:
+        if pattern is None:
             return filename.replace(find_text, replace_text)
-        else:
-            # 不区分大小写的替换
-            flags = re.IGNORECASE
-            return re.sub(re.escape(find_text), replace_text, filename, flags=flags)
+        # 不区分大小写的替换，替换文本按原样插入，不解析其中的反斜杠
+        return pattern.sub(lambda match: replace_text, filename)
     
     def preview_replace(self):
         """预览替换结果"""
@@ -236,55 +180,41 @@ class ReplaceInFilenamesDialog(QDialog):
         files_to_replace = 0
         replace_text = self.replace_edit.text()
         match_case = self.match_case_check.isChecked()
+        find_pattern = self.compile_find_pattern(find_text, match_case)
+        name_filter = self.build_name_filter(find_text, match_case)
+        log_lines = []
         
         for file_path in files_to_process:
+            # 每个文件只计算一次相对路径，用于输出日志
+            rel_path = self.get_rel_path(file_path)
             try:
                 # 获取文件名
                 dir_path, filename = os.path.split(file_path)
                 
-                # 获取新文件名
-                new_filename = self.get_new_filename(filename, find_text, replace_text, match_case)
+                # 获取新文件名，文件名中不含查找文本时无需替换
+                if name_filter is not None and not name_filter(filename):
+                    new_filename = filename
+                else:
+                    new_filename = self.get_new_filename(filename, find_text, replace_text, find_pattern)
                 
                 # 检查文件名是否有变化
                 if new_filename != filename:
                     # 检查新文件名是否已存在
                     new_file_path = os.path.join(dir_path, new_filename)
                     if os.path.exists(new_file_path):
-                        try:
-                            # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                            rel_path = os.path.relpath(file_path, self.folder_path)
-                        except ValueError:
-                            # 如果路径在不同驱动器上，直接使用文件名
-                            rel_path = os.path.basename(file_path)
-                        self.log_edit.append(f"警告: {rel_path} -> {new_filename} (目标文件已存在，将被跳过)")
+                        log_lines.append(f"警告: {rel_path} -> {new_filename} (目标文件已存在，将被跳过)")
                     else:
                         files_to_replace += 1
                         self.preview_results.append((file_path, new_filename))
-                        try:
-                            # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                            rel_path = os.path.relpath(file_path, self.folder_path)
-                        except ValueError:
-                            # 如果路径在不同驱动器上，直接使用文件名
-                            rel_path = os.path.basename(file_path)
-                        self.log_edit.append(f"将替换: {rel_path} -> {new_filename}")
+                        log_lines.append(f"将替换: {rel_path} -> {new_filename}")
                 else:
                     # 文件名中不存在要查找的字符
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    self.log_edit.append(f"无需替换: {rel_path}")
+                    log_lines.append(f"无需替换: {rel_path}")
             
             except Exception as e:
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"检查文件 {rel_path} 时出错: {str(e)}")
+                log_lines.append(f"检查文件 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         self.log_edit.append(f"\n预览完成！")
         self.log_edit.append(f"将替换: {files_to_replace} 个文件的文件名")
@@ -329,44 +259,36 @@ class ReplaceInFilenamesDialog(QDialog):
         
         files_replaced = 0
         errors = 0
+        log_lines = []
+        
+        # 按路径深度从深到浅处理，子文件夹中的文件先于上层文件处理（同一深度保持预览顺序）
+        self.preview_results.sort(key=lambda item: item[0].count(os.sep), reverse=True)
+        
+        # 循环中反复使用的函数先取到局部变量
+        rename = rename_no_replace
+        split = os.path.split
+        join = os.path.join
+        get_rel_path = self.get_rel_path
         
         for file_path, new_filename in self.preview_results:
+            rel_path = get_rel_path(file_path)
             try:
-                # 获取目录路径
-                dir_path = os.path.dirname(file_path)
-                new_file_path = os.path.join(dir_path, new_filename)
+                # 新文件名放在原文件所在目录下
+                new_file_path = join(split(file_path)[0], new_filename)
                 
-                # 再次检查文件是否存在，避免并发问题
-                if not os.path.exists(new_file_path):
-                    # 执行重命名
-                    os.rename(file_path, new_file_path)
-                    files_replaced += 1
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    self.log_edit.append(f"已替换: {rel_path} -> {new_filename}")
-                else:
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    self.log_edit.append(f"跳过: {rel_path} (目标文件已存在)")
-                    errors += 1
-                    
+                # 执行重命名，目标文件已存在时（如预览后新建了同名文件）不覆盖
+                rename(file_path, new_file_path)
+                files_replaced += 1
+                log_lines.append(f"已替换: {rel_path} -> {new_filename}")
+            
+            except FileExistsError:
+                log_lines.append(f"跳过: {rel_path} (目标文件已存在)")
+                errors += 1
             except Exception as e:
                 errors += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"替换 {rel_path} 时出错: {str(e)}")
+                log_lines.append(f"替换 {rel_path} 时出错: {str(e)}")
+        
+        append_log_lines(self.log_edit, log_lines)
         
         # 完成消息
         self.log_edit.append(f"\n替换完成！")
@@ -1,84 +1,651 @@
 import os
 import re
-import datetime
+import mmap
+import bisect
 import sys
+import multiprocessing
+import warnings
 from typing import List
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QFileDialog, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox, QSizePolicy, QStyledItemDelegate, QStyleOptionViewItem, QStyle, QApplication, QWidget, QAbstractItemView, QTableWidget, QTableWidgetItem, QHeaderView
-from PyQt6.QtCore import Qt, QModelIndex, QRect, pyqtSignal, QEvent, QSize
-from PyQt6.QtGui import QPainter, QColor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QLabel, QMessageBox, QLineEdit, QHBoxLayout, QTextEdit, QCheckBox, QComboBox, QSizePolicy, QStyledItemDelegate, QStyleOptionViewItem, QStyle, QApplication, QWidget, QAbstractItemView, QTableView, QHeaderView, QProgressBar
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QRect, pyqtSignal, QEvent, QSize, QObject, QRunnable, QThreadPool, QTimer
+from PyQt6.QtGui import QPainter, QColor, QTextCursor
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 # 确保能够导入database模块
-from database import execute_query, execute_non_query, create_table, table_exists
+from database import execute_query, execute_non_query, execute_many, create_table, transaction
 
+from .file_utils import FolderFileToolMixin, atomic_write, check_text_header, read_text_file_bytes, MMAP_THRESHOLD, MAX_READ_WORKERS
 
-class SearchHistoryDelegate(QStyledItemDelegate):
-    """自定义委托类，用于显示搜索历史记录"""
+try:
+    # 可选依赖：安装pyahocorasick后，普通文本的多个关键词只需扫描一遍文件内容
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# 同时提交到线程池的文件数上限，已完成但尚未交给主线程的结果（含文件内容）不会无限累积
+_MAX_PENDING_FILES = MAX_READ_WORKERS * 4
+# 替换时最多使用的进程数，正则替换和编码主要占用CPU，多进程不受GIL限制
+_MAX_PROCESS_WORKERS = os.cpu_count() or 1
+# 待替换文件的总大小达到该值时才使用进程池：每个工作进程启动时都要重新导入PyQt6和主程序，
+# 数百个几十KB的小文件在进程池中仍比线程池慢
+_PROCESS_POOL_MIN_BYTES = 64 * 1024 * 1024
+# 每个工作进程至少分到的文件数，文件较少时少启动几个进程
+_PROCESS_POOL_FILES_PER_WORKER = 4
+
+# 句子分隔符（中英文句号、问号、感叹号），分句正则只编译一次，所有文件共用
+_SENTENCE_SEPARATORS = '.!?。？！'
+_SENTENCE_SPLIT_PATTERN = re.compile(r'[.!?。？！]+')
+
+# 后台任务日志的批量写入间隔（毫秒）和缓存行数上限
+_LOG_FLUSH_INTERVAL = 100
+_LOG_FLUSH_LINES = 500
+
+# 不含关键词的文件缓存条数上限，超过后清空重新记录
+_NO_MATCH_CACHE_SIZE = 10000
+
+# 搜索下拉框中显示的历史记录条数
+_SEARCH_HISTORY_LIMIT = 20
+# 历史记录管理窗口每次从数据库读取的行数，滚动到表格底部时再读取下一批
+_HISTORY_PAGE_SIZE = 500
+
+
+# 搜索历史表的列定义
+_SEARCH_HISTORY_COLUMNS = {
+    'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+    'search_text': 'TEXT NOT NULL',
+    'count': 'INTEGER DEFAULT 1',
+    'last_used': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+}
+
+
+# 搜索历史表的索引是否已确认存在
+_search_history_indexed = False
+
+
+def _ensure_search_history_table():
+    """
+    确保搜索历史表及其索引存在：search_text上的唯一索引，以及按最后使用时间排序用的索引
+    create_table会记住已存在的表，只有第一次调用时查询数据库，之后直接返回
+    """
+    global _search_history_indexed
+    create_table('search_history', _SEARCH_HISTORY_COLUMNS)
+    if _search_history_indexed:
+        return
     
-    def paint(self, painter, option, index):
-        # 绘制正常的文本内容
-        super().paint(painter, option, index)
+    # 去重和建索引在同一个事务中完成，只提交一次
+    with transaction():
+        index_exists = execute_query(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_search_history_text'")
+        if not index_exists:
+            # 旧版本的数据库中可能有重复的搜索词，建唯一索引前只保留每个搜索词最新的一条
+            execute_non_query(
+                "DELETE FROM search_history WHERE id NOT IN "
+                "(SELECT MAX(id) FROM search_history GROUP BY search_text)")
+            execute_non_query(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_search_history_text ON search_history(search_text)")
+        # 历史记录管理窗口按最后使用时间分页读取，有索引时无需对整张表排序
+        execute_non_query(
+            "CREATE INDEX IF NOT EXISTS idx_search_history_last_used ON search_history(last_used)")
+    _search_history_indexed = True
+
+
+def _get_search_history_database(limit: int = _SEARCH_HISTORY_LIMIT) -> List[str]:
+    """
+    获取最近使用的搜索词，按使用次数和最后使用时间排序
     
-    def sizeHint(self, option, index):
-        return super().sizeHint(option, index)
+    Args:
+        limit: 最多返回的条数
+    
+    Returns:
+        List[str]: 搜索历史记录列表，search_text有唯一索引，不会重复
+    """
+    _ensure_search_history_table()
+    query = "SELECT search_text FROM search_history ORDER BY count DESC, last_used DESC LIMIT ?"
+    return [row['search_text'] for row in execute_query(query, (limit,))]
 
 
-    def _get_search_history_database() -> List[str]:
-        """
-        获取搜索历史记录
+def _save_search_history_database(search_text: str) -> None:
+    """
+    保存搜索历史记录：新搜索词插入记录，已存在时使用次数加一并更新最后使用时间（本地时间），一条语句完成
+    
+    Args:
+        search_text: 要保存的搜索文本
+    """
+    _ensure_search_history_table()
+    upsert_query = """
+        INSERT INTO search_history (search_text, count, last_used)
+        VALUES (?, 1, datetime('now', 'localtime'))
+        ON CONFLICT(search_text) DO UPDATE SET
+            count = count + 1,
+            last_used = excluded.last_used
+    """
+    execute_non_query(upsert_query, (search_text,))
+
+
+def _delete_search_history_database(search_texts: List[str]) -> None:
+    """
+    删除指定的搜索历史记录，所有记录在同一个事务中删除，只提交一次
+    
+    Args:
+        search_texts: 要删除的搜索文本列表
+    """
+    _ensure_search_history_table()
+    query = "DELETE FROM search_history WHERE search_text = ?"
+    execute_many(query, [(search_text,) for search_text in search_texts])
+
+
+def _compile_keywords(search_keywords, use_regex, flags):
+    """将关键词编译为正则表达式，每次搜索或替换只编译一次，所有文件共用"""
+    if use_regex:
+        return [re.compile(keyword, flags) for keyword in search_keywords]
+    return [re.compile(re.escape(keyword), flags) for keyword in search_keywords]
+
+
+def _combine_keyword_patterns(search_keywords, keyword_patterns, use_regex, flags):
+    """
+    把多个普通文本关键词合并为一个正则表达式，查找匹配时只需扫描一遍内容，不适用时原样返回
+    关键词都不含句子分隔符时，匹配不会跨越句子，合并后包含关键词的句子与逐个关键词查找的结果相同；
+    正则表达式关键词可能含有分组引用或内联标记，不做合并
+    """
+    if use_regex or len(keyword_patterns) < 2:
+        return keyword_patterns
+    if any(c in _SENTENCE_SEPARATORS for keyword in search_keywords for c in keyword):
+        return keyword_patterns
+    return [re.compile("|".join(pattern.pattern for pattern in keyword_patterns), flags)]
+
+
+def _required_literal(keyword, flags):
+    """
+    找出正则表达式的任何匹配都必须包含的一段普通文本：取顶层连续的普通字符中最长的一段
+    
+    Returns:
+        (普通文本, 是否忽略大小写): 无法确定时普通文本为None
+    """
+    try:
+        # re._parser是CPython的内部模块，位置变化时只是不做筛选，不影响工具本身
+        from re import _parser as _re_parser
+    except ImportError:
+        return None, False
+    try:
+        # 关键词编译时已经给出过警告（如可能的嵌套集合），这里不再重复
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            parsed = _re_parser.parse(keyword, flags)
+    except Exception:
+        return None, False
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+    best = current = ''
+    for op, av in parsed:
+        if op is _re_parser.LITERAL:
+            current += chr(av)
+            if len(current) > len(best):
+                best = current
+        else:
+            current = ''
+    return best or None, ignore_case
+
+
+def _build_byte_filter(search_keywords, use_regex, case_sensitive):
+    """
+    返回直接在文件原始字节上判断是否可能包含关键词的函数，不适用时返回None
+    UTF-8编码可以自同步，文本中包含关键词当且仅当其字节中包含关键词的UTF-8编码，不含关键词的文件无需解码即可跳过；
+    正则表达式关键词按其匹配必须包含的普通文本判断，任一关键词找不到这样的文本时不做筛选
+    """
+    if use_regex:
+        literals = []
+        for keyword in search_keywords:
+            literal, ignore_case = _required_literal(keyword, 0 if case_sensitive else re.IGNORECASE)
+            if literal is None:
+                return None
+            literals.append(literal)
+            # 正则表达式中的(?i)对整个表达式生效
+            case_sensitive = case_sensitive and not ignore_case
+        search_keywords = literals
+    # 读取后会统一换行符，含有换行符的关键词不能直接按原始字节判断
+    if any('\r' in keyword or '\n' in keyword for keyword in search_keywords):
+        return None
+    if case_sensitive:
+        byte_keywords = [keyword.encode('utf-8') for keyword in search_keywords]
+        # 使用find而不是in，内存映射对象的in只能判断单个字节
+        return lambda data: any(data.find(keyword) != -1 for keyword in byte_keywords)
+    # 不区分大小写时只处理ASCII关键词，UTF-8中ASCII字节只表示ASCII字符本身
+    if not all(keyword.isascii() for keyword in search_keywords):
+        return None
+    byte_keywords = [keyword.encode('ascii') for keyword in search_keywords]
+    # 不区分大小写时 i、k、s 还与非ASCII字符（İ、ı、K、ſ）匹配，只按ASCII字节判断会漏掉这些匹配
+    if any(c in 'iks' for keyword in search_keywords for c in keyword.lower()):
+        return None
+    pattern = re.compile(b'|'.join(map(re.escape, byte_keywords)), re.IGNORECASE)
+    return lambda data: pattern.search(data) is not None
+
+
+def _split_sentences(content):
+    """
+    按句子分隔符划分文本，一次扫描得到每个句子的位置，句子末尾的分隔符属于该句子
+    
+    Returns:
+        (句子位置列表, 句子结束位置列表): 句子位置为 (起始位置, 结束位置)，按顺序排列、首尾相接
+    """
+    sentence_positions = []
+    start = 0
+    for match in _SENTENCE_SPLIT_PATTERN.finditer(content):
+        sentence_positions.append((start, match.end()))
+        start = match.end()
+    if start < len(content):
+        sentence_positions.append((start, len(content)))
+    return sentence_positions, [end for _, end in sentence_positions]
+
+
+def _find_sentence(sentence_positions, sentence_ends, pos):
+    """
+    二分查找位置所在的句子，句子按起始位置排列、互不重叠
+    
+    Args:
+        sentence_ends: 每个句子的结束位置列表，与sentence_positions一一对应
+    
+    Returns:
+        句子序号，位置不在任何句子中时返回-1
+    """
+    i = bisect.bisect_right(sentence_ends, pos)
+    if i < len(sentence_ends) and sentence_positions[i][0] <= pos:
+        return i
+    return -1
+
+
+def _build_automaton(search_keywords, use_regex, case_sensitive):
+    """
+    区分大小写的普通文本搜索有多个关键词时，把所有关键词构建为一个Aho-Corasick自动机，所有文件共用
+    未安装pyahocorasick或不适用时返回None，使用正则表达式查找；
+    只有一个关键词时正则表达式按字面字符串查找更快，也返回None
+    """
+    if ahocorasick is None or use_regex or not case_sensitive or len(search_keywords) < 2:
+        return None
+    automaton = ahocorasick.Automaton()
+    for index, keyword in enumerate(search_keywords):
+        automaton.add_word(keyword, (index, len(keyword)))
+    automaton.make_automaton()
+    return automaton
+
+
+def _find_with_automaton(automaton, content, keyword_count):
+    """
+    用自动机一次扫描找出所有关键词的位置，按关键词分组返回起始位置列表
+    每个关键词只保留互不重叠的匹配，与re.finditer逐个关键词查找的结果一致
+    """
+    starts = [[] for _ in range(keyword_count)]
+    next_start = [0] * keyword_count
+    for end, (index, length) in automaton.iter(content):
+        start = end - length + 1
+        if start >= next_start[index]:
+            starts[index].append(start)
+            next_start[index] = end + 1
+    return starts
+
+
+def _search_file(file_path, keyword_patterns, byte_filter=None, automaton=None, no_match_cache=None):
+    """
+    读取文件并按句子查找关键词，在线程池中执行
+    
+    Args:
+        no_match_cache: 不含关键词的文件 {文件路径: (修改时间, 文件大小)}，
+            修改时间和大小都没有变化的文件直接跳过，不再读取
+    
+    Returns:
+        (文件内容, 匹配列表, (修改时间, 文件大小)): 每个包含关键词的句子只保留其中第一个匹配，
+        使用自动机查找时匹配为起始位置，文件不含关键词时为(None, [], (修改时间, 文件大小))
+    """
+    # 在读取之前记录修改时间，替换时据此判断文件在搜索后是否被修改过
+    st = os.stat(file_path)
+    mtime_ns = st.st_mtime_ns
+    stat_key = (mtime_ns, st.st_size)
+    if no_match_cache is not None and no_match_cache.get(file_path) == stat_key:
+        return None, [], stat_key
+    
+    with open(file_path, 'rb', buffering=0) as f:
+        # 先检查文件开头，二进制文件不读取全部内容
+        check_text_header(f)
+        if byte_filter is not None and st.st_size > MMAP_THRESHOLD:
+            # 大文件先在内存映射上按字节判断，不含关键词时无需读取和解码
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if not byte_filter(mm):
+                    _cache_no_match(no_match_cache, file_path, stat_key)
+                    return None, [], stat_key
+                data = mm[:]
+        else:
+            data = f.readall()
+            if byte_filter is not None and not byte_filter(data):
+                _cache_no_match(no_match_cache, file_path, stat_key)
+                return None, [], stat_key
+    
+    # 与文本模式读取一致：解码后把 \r\n 和 \r 统一转换为 \n
+    content = data.decode('utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    
+    # 按句子分割文本（使用中英文句号、问号、感叹号作为分隔符）
+    sentence_positions, sentence_ends = _split_sentences(content)
+    
+    # 对于每个句子，检查是否包含任何关键词
+    unique_matches = []
+    matched_sentence_indices = set()
+    
+    if automaton is not None:
+        keyword_matches = _find_with_automaton(automaton, content, len(keyword_patterns))
+    else:
+        keyword_matches = (pattern.finditer(content) for pattern in keyword_patterns)
+    
+    for matches in keyword_matches:
+        # 对于每个匹配，找出它属于哪个句子
+        for match in matches:
+            match_pos = match if automaton is not None else match.start()
+            # 查找匹配位置所在的句子
+            i = _find_sentence(sentence_positions, sentence_ends, match_pos)
+            if i != -1 and i not in matched_sentence_indices:
+                matched_sentence_indices.add(i)
+                unique_matches.append(match)
+    
+    if not unique_matches:
+        _cache_no_match(no_match_cache, file_path, stat_key)
+        return None, [], stat_key
+    return content, unique_matches, stat_key
+
+
+def _cache_no_match(no_match_cache, file_path, stat_key):
+    """记录不含关键词的文件，缓存超过上限时清空"""
+    if no_match_cache is None:
+        return
+    if len(no_match_cache) >= _NO_MATCH_CACHE_SIZE:
+        no_match_cache.clear()
+    no_match_cache[file_path] = stat_key
+
+
+class _FileChangedError(Exception):
+    """文件在搜索之后被修改过"""
+
+
+def _replace_file(file_path, search_keywords, keyword_patterns, count_patterns, replace_text, literal_replace, mtimes,
+                  automaton=None):
+    """
+    重新读取文件并替换所有关键词后写回，在线程池中执行
+    
+    Args:
+        count_patterns: 统计包含关键词的句子时使用的正则表达式，可以是合并后的关键词
+        literal_replace: 是否为区分大小写的普通文本替换，是则直接使用字符串替换
+        mtimes: 搜索时记录的 {文件路径: 修改时间}，文件修改时间不一致时抛出_FileChangedError，不做替换
+        automaton: 所有关键词构建的Aho-Corasick自动机，不为None时用它一次扫描统计包含关键词的句子
+    
+    Returns:
+        (替换计数, 是否已写回文件): 替换计数为包含关键词的句子数量，替换后内容没有变化时不写回文件
+    """
+    # 搜索之后文件被修改过（包括已经执行过替换），匹配结果已经不可靠
+    if os.stat(file_path).st_mtime_ns != mtimes[file_path]:
+        raise _FileChangedError
+    # 预览时没有保留文件内容，这里重新读取，与搜索时一样按字节读取后一次解码
+    original_content = read_text_file_bytes(file_path).decode('utf-8')
+    if '\r' in original_content:
+        original_content = original_content.replace('\r\n', '\n').replace('\r', '\n')
+    
+    # 执行替换，同时按照句子级别计算匹配数
+    new_content = original_content
+    
+    # 按句子分割文本（使用中英文句号、问号、感叹号作为分隔符）
+    sentence_positions, sentence_ends = _split_sentences(original_content)
+    
+    # 统计包含至少一个关键词的句子数量
+    matched_sentence_indices = set()
+    if len(keyword_patterns) == 1 and (literal_replace or '\\' not in replace_text):
+        # 只有一个关键词且替换文本中没有反斜杠（不含分组引用）时，替换文本按原样插入，
+        # 统计句子和替换在同一次扫描中完成，与先统计再替换的结果相同
+        parts = []
+        last_end = 0
+        for match in keyword_patterns[0].finditer(original_content):
+            start = match.start()
+            i = _find_sentence(sentence_positions, sentence_ends, start)
+            if i != -1:
+                matched_sentence_indices.add(i)
+            parts.append(original_content[last_end:start])
+            parts.append(replace_text)
+            last_end = match.end()
+        if parts:
+            parts.append(original_content[last_end:])
+            new_content = ''.join(parts)
+    else:
+        if automaton is not None:
+            keyword_starts = _find_with_automaton(automaton, original_content, len(search_keywords))
+        else:
+            keyword_starts = ((match.start() for match in pattern.finditer(original_content))
+                              for pattern in count_patterns)
         
-        Returns:
-            List[str]: 搜索历史记录列表
-        """
-        # 确保表存在
-        if not table_exists('search_history'):
-            create_table('search_history', {
-                'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
-                'search_text': 'TEXT NOT NULL',
-                'search_time': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            })
+        for starts in keyword_starts:
+            # 对于每个匹配，找出它属于哪个句子
+            for start in starts:
+                i = _find_sentence(sentence_positions, sentence_ends, start)
+                if i != -1:
+                    matched_sentence_indices.add(i)
         
-        # 查询最近的搜索记录（最多20条）
-        query = "SELECT search_text FROM search_history ORDER BY search_time DESC LIMIT 20"
-        results = execute_query(query)
-        return [row['search_text'] for row in results]
+        # 执行实际替换，每个关键词只扫描一遍内容；多个关键词依次替换，后面的关键词作用于前面替换后的内容
+        # 替换计数使用句子级别的统计，这里不再单独统计实际替换次数
+        for keyword, pattern in zip(search_keywords, keyword_patterns):
+            if literal_replace:
+                # 区分大小写的普通文本直接使用字符串替换
+                new_content = new_content.replace(keyword, replace_text)
+            else:
+                new_content = pattern.sub(replace_text, new_content)
+    
+    # 使用句子级别的计数作为替换计数
+    count = len(matched_sentence_indices)
+    
+    # 替换后内容没有变化（如替换为相同文本）时无需写回文件
+    if new_content == original_content:
+        return count, False
+    
+    # 写入新内容：与文本模式写入一致，换行符转换为系统默认换行符，只编码一次
+    data = new_content.encode('utf-8')
+    if os.linesep != '\n':
+        data = data.replace(b'\n', os.linesep.encode('ascii'))
+    # 先写临时文件再替换原文件，写入失败时原文件不受影响
+    atomic_write(file_path, (data,))
+    return count, True
+
+
+def _process_worker_count(file_count, total_bytes):
+    """
+    按待替换文件的数量和总大小决定替换使用的进程数，返回0时使用线程池
+    进程数不超过CPU数，也不超过文件数按每个进程至少分到的文件数折算的数量
+    """
+    if total_bytes < _PROCESS_POOL_MIN_BYTES:
+        return 0
+    workers = min(_MAX_PROCESS_WORKERS, file_count // _PROCESS_POOL_FILES_PER_WORKER)
+    # 只有一个工作进程时不能并行处理，还要多付出启动进程的开销
+    return workers if workers > 1 else 0
+
+
+# 进程池工作进程中的任务函数和参数，进程启动时设置一次，每个文件只需传递文件路径
+_worker_func = None
+_worker_args = ()
+
+
+def _init_process_worker(func, args):
+    """进程池工作进程的初始化函数"""
+    global _worker_func, _worker_args
+    _worker_func = func
+    _worker_args = args
 
 
-    def _delete_search_history_database(search_text: str) -> None:
+def _run_in_process_worker(file_path):
+    """在进程池工作进程中处理单个文件"""
+    return _worker_func(file_path, *_worker_args)
+
+
+class _FileTaskSignals(QObject):
+    """后台文件任务的信号，从工作线程投递到主线程中处理"""
+    result = pyqtSignal(str, object)  # (文件路径, 已完成的Future)
+    finished = pyqtSignal()
+
+
+class _FileTask(QRunnable):
+    """
+    在QThreadPool中执行的后台文件任务
+    内部用线程池并发处理每个文件，再按文件顺序通过信号把结果交给主线程输出日志，处理期间界面保持响应
+    process_workers大于0时改用该数量的进程池，func和参数需要可以pickle，结果和异常同样在进程之间传递
+    """
+    def __init__(self, func, file_paths, *args, process_workers=0):
+        super().__init__()
+        self.func = func
+        self.file_paths = file_paths
+        self.args = args
+        self.process_workers = process_workers
+        self.signals = _FileTaskSignals()
+        self._cancelled = False
+    
+    def cancel(self):
+        """取消任务，尚未开始处理的文件不再处理"""
+        self._cancelled = True
+    
+    def create_pool(self):
         """
-        删除指定的搜索历史记录
-        
-        Args:
-            search_text: 要删除的搜索文本
+        创建执行任务的线程池或进程池，返回 (池, 提交单个文件的函数)
+        进程池使用spawn方式启动，不在已有多个线程的进程中fork；任务函数和参数在工作进程启动时只传递一次
         """
-        if table_exists('search_history'):
-            query = "DELETE FROM search_history WHERE search_text = ?"
-            execute_non_query(query, (search_text,))
+        if self.process_workers:
+            pool = ProcessPoolExecutor(max_workers=self.process_workers,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_process_worker,
+                                       initargs=(self.func, self.args))
+            return pool, lambda file_path: pool.submit(_run_in_process_worker, file_path)
+        pool = ThreadPoolExecutor(max_workers=MAX_READ_WORKERS)
+        return pool, lambda file_path: pool.submit(self.func, file_path, *self.args)
+    
+    def run(self):
+        file_paths = iter(self.file_paths)
+        pending = deque()
+        pool, submit = self.create_pool()
+        with pool:
+            # 按顺序提交文件，每交出一个结果再提交下一个，始终只有有限个文件在处理或等待输出
+            for file_path in file_paths:
+                pending.append((file_path, submit(file_path)))
+                if len(pending) >= _MAX_PENDING_FILES:
+                    break
+            while pending:
+                if self._cancelled:
+                    for _, future in pending:
+                        future.cancel()
+                    break
+                file_path, future = pending.popleft()
+                # 等待该文件处理完成，处理中的异常由主线程调用future.result()时处理
+                wait((future,))
+                self.signals.result.emit(file_path, future)
+                next_path = next(file_paths, None)
+                if next_path is not None:
+                    pending.append((next_path, submit(next_path)))
+        self.signals.finished.emit()
 
 
-    def _save_search_history_database(search_text: str) -> None:
+class SearchHistoryDelegate(QStyledItemDelegate):
+    """自定义委托类，用于显示搜索历史记录"""
+    
+    def paint(self, painter, option, index):
+        # 绘制正常的文本内容
+        super().paint(painter, option, index)
+    
+    def sizeHint(self, option, index):
+        return super().sizeHint(option, index)
+
+
+class SearchHistoryModel(QAbstractTableModel):
+    """
+    历史记录表格的数据模型，每行数据保存为一个元组
+    表格只在绘制可见单元格时读取数据，无需为每个单元格创建QTableWidgetItem；
+    数据按最后使用时间分批从数据库读取，表格滚动到底部时才读取下一批
+    """
+    HEADERS = ("搜索内容", "使用次数", "最后使用时间")
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # (搜索内容, 使用次数, 最后使用时间)
+        self._has_more = False  # 数据库中是否还有未读取的记录
+    
+    @staticmethod
+    def query_page(offset):
         """
-        保存搜索历史记录
-        
-        Args:
-            search_text: 要保存的搜索文本
+        从数据库读取一批历史记录，按最后使用时间从新到旧排序
+        id作为第二排序条件，最后使用时间相同的记录在分页之间顺序固定
         """
-        # 确保表存在
-        if not table_exists('search_history'):
-            create_table('search_history', {
-                'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
-                'search_text': 'TEXT NOT NULL',
-                'search_time': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            })
-        
-        # 先删除可能已存在的相同记录
-        delete_query = "DELETE FROM search_history WHERE search_text = ?"
-        execute_non_query(delete_query, (search_text,))
-        
-        # 插入新记录
-        insert_query = "INSERT INTO search_history (search_text) VALUES (?);"
-        execute_non_query(insert_query, (search_text,))
+        query = """
+            SELECT search_text, count, last_used FROM search_history
+            ORDER BY last_used DESC, id DESC LIMIT ? OFFSET ?
+        """
+        return [
+            (row['search_text'], str(row['count']), row['last_used'])
+            for row in execute_query(query, (_HISTORY_PAGE_SIZE, offset))
+        ]
+    
+    def load(self):
+        """重新读取第一批历史记录，整个表格只刷新一次"""
+        rows = self.query_page(0)
+        self.set_rows(rows, len(rows) == _HISTORY_PAGE_SIZE)
+    
+    def set_rows(self, rows, has_more=False):
+        """替换全部数据，整个表格只刷新一次"""
+        self.beginResetModel()
+        self._rows = rows
+        self._has_more = has_more
+        self.endResetModel()
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        try:
+            rows = self.query_page(len(self._rows))
+        except Exception as e:
+            print(f"加载历史记录时出错: {e}")
+            self._has_more = False
+            return
+        self._has_more = len(rows) == _HISTORY_PAGE_SIZE
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+    
+    def search_text(self, row):
+        """获取指定行的搜索内容"""
+        return self._rows[row][0]
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._rows[index.row()][index.column()]
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() == 1:
+            return Qt.AlignmentFlag.AlignCenter
+        return None
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def flags(self, index):
+        # 不包含ItemIsEditable，表格只读
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+    
+    def removeRows(self, row, count, parent=QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self._rows[row:row + count]
+        self.endRemoveRows()
+        return True
 
 
 class HistoryManagerDialog(QDialog):
@@ -101,9 +668,9 @@ class HistoryManagerDialog(QDialog):
         main_layout.addWidget(title_label)
         
         # 历史记录表格
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(3)
-        self.history_table.setHorizontalHeaderLabels(["搜索内容", "使用次数", "最后使用时间"])
+        self.history_model = SearchHistoryModel(self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         # 设置列宽
         self.history_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         self.history_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
@@ -130,55 +697,26 @@ class HistoryManagerDialog(QDialog):
     
     def load_history_data(self):
         """加载历史记录数据到表格"""
-        # 清空表格
-        self.history_table.setRowCount(0)
-        
-        # 从数据库加载历史记录
-        query = "SELECT search_text, count, last_used FROM search_history ORDER BY last_used DESC"
+        # 从数据库加载第一批历史记录，其余记录在表格滚动到底部时再读取
         try:
-            results = execute_query(query)
-            
-            # 添加数据到表格
-            for row_idx, row in enumerate(results):
-                self.history_table.insertRow(row_idx)
-                
-                # 搜索内容
-                text_item = QTableWidgetItem(row['search_text'])
-                text_item.setFlags(text_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
-                self.history_table.setItem(row_idx, 0, text_item)
-                
-                # 使用次数
-                count_item = QTableWidgetItem(str(row['count']))
-                count_item.setFlags(count_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
-                count_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.history_table.setItem(row_idx, 1, count_item)
-                
-                # 最后使用时间
-                time_item = QTableWidgetItem(row['last_used'])
-                time_item.setFlags(time_item.flags() & ~Qt.ItemFlag.ItemIsEditable)
-                self.history_table.setItem(row_idx, 2, time_item)
+            self.history_model.load()
                 
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载历史记录失败: {str(e)}")
     
     def delete_selected_history(self):
         """删除选中的历史记录"""
-        selected_rows = set(item.row() for item in self.history_table.selectedItems())
+        selected_rows = set(index.row() for index in self.history_table.selectionModel().selectedIndexes())
         
         if not selected_rows:
             QMessageBox.information(self, "提示", "请先选择要删除的历史记录")
             return
         
         try:
-            deleted_count = 0
-            for row_idx in sorted(selected_rows, reverse=True):
-                search_text = self.history_table.item(row_idx, 0).text()
-                # 删除数据库中的记录
-                query = "DELETE FROM search_history WHERE search_text = ?"
-                execute_non_query(query, (search_text,))
-                # 从表格中删除行
-                self.history_table.removeRow(row_idx)
-                deleted_count += 1        
+            # 所有选中记录在同一个事务中删除，只提交一次
+            _delete_search_history_database([self.history_model.search_text(row_idx) for row_idx in selected_rows])
+            # 删除完成后重新加载，表格只刷新一次
+            self.load_history_data()
             
             # 如果父窗口存在，刷新父窗口的搜索历史
             if self.parent and hasattr(self.parent, 'load_search_history'):
@@ -202,7 +740,7 @@ class HistoryManagerDialog(QDialog):
             execute_non_query(query)
             
             # 清空表格
-            self.history_table.setRowCount(0)
+            self.history_model.set_rows([])
             
             QMessageBox.information(self, "成功", "所有历史记录已清空")
             
@@ -213,20 +751,30 @@ class HistoryManagerDialog(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"清空历史记录失败: {str(e)}")
 
-class SearchReplaceDialog(QDialog):
+class SearchReplaceDialog(FolderFileToolMixin, QDialog):
     """文件夹内搜索替换工具对话框"""
+    skip_binary_files = True
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
         self.folder_path = ""  # 初始文件夹路径为空
-        self.preview_results = []  # 存储预览结果
+        self.preview_results = []  # 存储预览结果 (文件路径, 修改时间, 文件大小, 匹配数)，不保存文件内容
+        self._task = None  # 正在后台执行的搜索或替换任务
+        self._replace_after_search = False  # 搜索完成后是否继续执行替换
+        # 上次搜索中不含关键词的文件，关键词和选项不变时再次搜索可直接跳过未修改的文件
+        self._no_match_cache = {}
+        self._no_match_cache_key = None
+        # 后台任务的日志先缓存起来，定时批量写入日志区域
+        self._log_buffer = []
+        self._log_timer = QTimer(self)
+        self._log_timer.setSingleShot(True)
+        self._log_timer.setInterval(_LOG_FLUSH_INTERVAL)
+        self._log_timer.timeout.connect(self.flush_log)
         # 从config.json中获取窗口标题（使用工具名称）
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'SearchReplaceDialog':
-                    self.setWindowTitle(tool.name)
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            self.setWindowTitle(tool.name)
         # 初始化数据库
         self.init_database()
         self.init_ui()
@@ -234,37 +782,25 @@ class SearchReplaceDialog(QDialog):
     def init_database(self):
         """初始化搜索历史记录表"""
         # 检查并创建搜索历史表
-        if not table_exists('search_history'):
-            columns = {
-                'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
-                'search_text': 'TEXT NOT NULL',
-                'count': 'INTEGER DEFAULT 1',
-                'last_used': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            }
-            create_table('search_history', columns)
+        _ensure_search_history_table()
     
     def load_search_history(self):
         """加载搜索历史到下拉框"""
-        # 从数据库获取最近使用的搜索词（按使用次数和最后使用时间排序）
-        query = "SELECT search_text FROM search_history ORDER BY count DESC, last_used DESC LIMIT 20"
         try:
-            results = execute_query(query)
-            # 清空下拉框中的历史记录（保留当前输入）
+            # 从数据库获取最近使用的搜索词（按使用次数和最后使用时间排序），一次性添加到下拉框
+            texts = _get_search_history_database()
+            # 清空下拉框中的历史记录（保留当前输入），修改期间不触发文本变化信号
             current_text = self.search_edit.currentText()
-            self.search_edit.clear()
-            # 添加历史记录（去重）
-            added_texts = set()
-            has_history = False
-            for row in results:
-                search_text = row['search_text']
-                if search_text not in added_texts:
-                    self.search_edit.addItem(search_text)
-                    added_texts.add(search_text)
-                    has_history = True
-            # 当没有历史记录时，添加一个不可选的提示项
-            if not has_history:
-                placeholder_index = self.search_edit.addItem("(无历史记录)")
-                self.search_edit.model().item(placeholder_index).setEnabled(False)
+            self.search_edit.blockSignals(True)
+            try:
+                self.search_edit.clear()
+                self.search_edit.addItems(texts)
+                # 当没有历史记录时，添加一个不可选的提示项
+                if not texts:
+                    self.search_edit.addItem("(无历史记录)")
+                    self.search_edit.model().item(0).setEnabled(False)
+            finally:
+                self.search_edit.blockSignals(False)
             # 恢复当前输入（如果有），否则保持不选中任何项
             if current_text:
                 self.search_edit.setCurrentText(current_text)
@@ -280,35 +816,34 @@ class SearchReplaceDialog(QDialog):
             return
         
         try:
-            # 检查是否已存在该搜索词
-            query = "SELECT id, count FROM search_history WHERE search_text = ?"
-            result = execute_query(query, (search_text,))
-            
-            if result:
-                # 更新现有记录
-                search_id = result[0]['id']
-                new_count = result[0]['count'] + 1
-                update_query = "UPDATE search_history SET count = ?, last_used = ? WHERE id = ?"
-                execute_non_query(update_query, (new_count, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), search_id))
-            else:
-                # 插入新记录
-                insert_query = "INSERT INTO search_history (search_text, last_used) VALUES (?, ?)"
-                execute_non_query(insert_query, (search_text, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            _save_search_history_database(search_text)
         except Exception as e:
             print(f"保存搜索历史时出错: {e}")
     
-    def center_window(self):
-        """将窗口设置在屏幕中央"""
-        # 获取屏幕可用几何区域
-        screen_geometry = self.screen().availableGeometry()
-        # 获取窗口大小
-        window_geometry = self.frameGeometry()
-        # 计算中心点
-        center_point = screen_geometry.center()
-        # 将窗口中心移动到屏幕中心
-        window_geometry.moveCenter(center_point)
-        # 应用位置
-        self.move(window_geometry.topLeft())
+    def add_search_history_item(self, search_text):
+        """
+        把刚使用的搜索词移到下拉框最前面，直接修改下拉框中的项，不重新查询数据库
+        """
+        if not search_text.strip():
+            return
+        
+        combo = self.search_edit
+        # 修改下拉框中的项时不触发文本变化信号
+        combo.blockSignals(True)
+        try:
+            index = combo.findText(search_text, Qt.MatchFlag.MatchExactly | Qt.MatchFlag.MatchCaseSensitive)
+            if index != 0:
+                if index > 0:
+                    combo.removeItem(index)
+                elif combo.count() == 1 and not combo.model().item(0).isEnabled():
+                    # 去掉"无历史记录"提示项
+                    combo.removeItem(0)
+                combo.insertItem(0, search_text)
+                while combo.count() > _SEARCH_HISTORY_LIMIT:
+                    combo.removeItem(combo.count() - 1)
+            combo.setCurrentIndex(0)
+        finally:
+            combo.blockSignals(False)
     
     def init_ui(self):
         # 设置窗口属性
@@ -347,6 +882,7 @@ class SearchReplaceDialog(QDialog):
         self.custom_type_edit.setPlaceholderText("例如: *.txt;*.md")
         self.custom_type_edit.setEnabled(False)
         self.file_type_combo.currentTextChanged.connect(self.on_file_type_changed)
+        self.custom_type_edit.textChanged.connect(self.invalidate_file_patterns)
         
         file_type_layout.addWidget(file_type_label)
         file_type_layout.addWidget(self.file_type_combo)
@@ -416,18 +952,23 @@ class SearchReplaceDialog(QDialog):
         
         # 操作按钮
         button_layout = QHBoxLayout()
-        preview_btn = QPushButton("搜索")
-        preview_btn.clicked.connect(self.preview_replace)
-        replace_btn = QPushButton("替换")
-        replace_btn.clicked.connect(self.start_replace)
+        self.preview_btn = QPushButton("搜索")
+        self.preview_btn.clicked.connect(self.preview_replace)
+        self.replace_btn = QPushButton("替换")
+        self.replace_btn.clicked.connect(self.start_replace)
         cancel_btn = QPushButton("取消")
         cancel_btn.clicked.connect(self.close)
         
-        button_layout.addWidget(preview_btn)
-        button_layout.addWidget(replace_btn)
+        button_layout.addWidget(self.preview_btn)
+        button_layout.addWidget(self.replace_btn)
         button_layout.addWidget(cancel_btn)
         main_layout.addLayout(button_layout)
         
+        # 后台任务进度，只在搜索或替换执行期间显示
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+        
         # 日志输出区域
         log_label = QLabel("操作日志:")
         main_layout.addWidget(log_label)
@@ -453,18 +994,6 @@ class SearchReplaceDialog(QDialog):
     
 
     
-    def on_file_type_changed(self, text):
-        """文件类型变化时的处理"""
-        self.custom_type_edit.setEnabled(text == "自定义...")
-    
-    def select_folder(self):
-        """选择文件夹"""
-        folder_path = QFileDialog.getExistingDirectory(self, "选择文件夹", "")
-        if folder_path:
-            self.folder_path = folder_path
-            self.folder_path_edit.setText(folder_path)
-            self.log_edit.append(f"已选择文件夹: {folder_path}")
-    
     def open_folder(self):
         """打开选中的文件夹"""
         if hasattr(self, 'folder_path') and os.path.isdir(self.folder_path):
@@ -480,62 +1009,6 @@ class SearchReplaceDialog(QDialog):
         else:
             self.log_edit.append("请先选择一个有效的文件夹")
     
-    def get_file_patterns(self):
-        """获取文件匹配模式"""
-        selected_type = self.file_type_combo.currentText()
-        if selected_type == "自定义...":
-            custom_pattern = self.custom_type_edit.text().strip()
-            if custom_pattern:
-                return [p.strip() for p in custom_pattern.split(';')]
-            else:
-                return ["*"]
-        elif selected_type == "所有文件 (*.*)":
-            return ["*"]
-        else:
-            # 从下拉选项中提取通配符
-            pattern_start = selected_type.find('(') + 1
-            pattern_end = selected_type.find(')')
-            if pattern_start > 0 and pattern_end > pattern_start:
-                pattern_text = selected_type[pattern_start:pattern_end]
-                return [p.strip() for p in pattern_text.split(';')]
-            return ["*"]
-    
-    def matches_file_pattern(self, filename, patterns):
-        """检查文件是否匹配任一模式"""
-        for pattern in patterns:
-            # 简单的通配符匹配
-            # 将 * 转换为 .* 用于正则匹配
-            regex_pattern = pattern.replace('.', '\\.').replace('*', '.*')
-            if re.match(f"^{regex_pattern}$", filename):
-                return True
-        return False
-    
-    def get_files_to_process(self):
-        """获取要处理的文件列表"""
-        if not self.folder_path:
-            return []
-        
-        files_to_process = []
-        file_patterns = self.get_file_patterns()
-        
-        try:
-            if self.include_subfolders_check.isChecked():
-                # 遍历所有子文件夹
-                for root, _, files in os.walk(self.folder_path):
-                    for filename in files:
-                        if self.matches_file_pattern(filename, file_patterns):
-                            files_to_process.append(os.path.join(root, filename))
-            else:
-                # 只处理当前文件夹
-                for filename in os.listdir(self.folder_path):
-                    file_path = os.path.join(self.folder_path, filename)
-                    if os.path.isfile(file_path) and self.matches_file_pattern(filename, file_patterns):
-                        files_to_process.append(file_path)
-        except Exception as e:
-            self.log_edit.append(f"获取文件列表时出错: {str(e)}")
-        
-        return files_to_process
-    
     def parse_search_keywords(self, search_input):
         """解析搜索关键词，支持空格或逗号分隔"""
         # 首先用逗号分隔
@@ -559,8 +1032,8 @@ class SearchReplaceDialog(QDialog):
 
         # 保存搜索词到数据库
         self.save_search_history(search_input)
-        # 重新加载搜索历史，更新下拉框
-        self.load_search_history()
+        # 更新下拉框中的搜索历史
+        self.add_search_history_item(search_input)
         
         # 解析多关键词
         search_keywords = self.parse_search_keywords(search_input)
@@ -573,139 +1046,166 @@ class SearchReplaceDialog(QDialog):
         files_to_process = self.get_files_to_process()
         self.log_edit.append(f"找到 {len(files_to_process)} 个文件待处理")
         
-        total_matches = 0
-        files_with_matches = 0
+        # 关键词在搜索前统一编译，正则表达式有误时直接提示
+        flags = 0 if self.case_sensitive_check.isChecked() else re.IGNORECASE
+        try:
+            keyword_patterns = _compile_keywords(search_keywords, self.use_regex_check.isChecked(), flags)
+        except re.error as e:
+            self.log_edit.append(f"正则表达式错误: {str(e)}")
+            QMessageBox.warning(self, "警告", f"正则表达式错误: {str(e)}")
+            return
+        byte_filter = _build_byte_filter(search_keywords, self.use_regex_check.isChecked(),
+                                         self.case_sensitive_check.isChecked())
+        automaton = _build_automaton(search_keywords, self.use_regex_check.isChecked(),
+                                     self.case_sensitive_check.isChecked())
+        if automaton is None:
+            # 没有自动机时，普通文本关键词合并为一个正则表达式，每个文件只扫描一遍
+            keyword_patterns = _combine_keyword_patterns(search_keywords, keyword_patterns,
+                                                         self.use_regex_check.isChecked(), flags)
         
-        for file_path in files_to_process:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # 执行搜索
-                flags = 0 if self.case_sensitive_check.isChecked() else re.IGNORECASE
-                
-                # 初始化变量
-                all_matches = []
-                
-                # 按句子分割文本（使用中英文句号、问号、感叹号作为分隔符）
-                sentences = re.split(r'[.!?。？！]+', content)
-                # 保存每个句子的起始和结束位置
-                sentence_positions = []
-                current_pos = 0
-                for sentence in sentences:
-                    # 查找句子在原始文本中的实际位置（考虑分隔符）
-                    # 尝试在当前位置之后查找句子
-                    pos = content.find(sentence, current_pos)
-                    if pos != -1:
-                        # 查找句子后面的分隔符
-                        separator_end = pos + len(sentence)
-                        while separator_end < len(content) and content[separator_end] in '.!?。？！':
-                            separator_end += 1
-                        sentence_positions.append((pos, separator_end))
-                        current_pos = separator_end
-                
-                # 对于每个句子，检查是否包含任何关键词
-                unique_matches = []
-                matched_sentence_indices = set()
-                
-                for keyword in search_keywords:
-                    if self.use_regex_check.isChecked():
-                        # 使用正则表达式搜索
-                        matches = list(re.finditer(keyword, content, flags))
-                    else:
-                        # 简单字符串搜索
-                        if self.case_sensitive_check.isChecked():
-                            matches = [match for match in re.finditer(re.escape(keyword), content)]
-                        else:
-                            matches = [match for match in re.finditer(re.escape(keyword), content, re.IGNORECASE)]
-                    
-                    # 对于每个匹配，找出它属于哪个句子
-                    for match in matches:
-                        match_pos = match.start()
-                        # 查找匹配位置所在的句子
-                        for i, (sentence_start, sentence_end) in enumerate(sentence_positions):
-                            if sentence_start <= match_pos < sentence_end:
-                                if i not in matched_sentence_indices:
-                                    matched_sentence_indices.add(i)
-                                    unique_matches.append(match)
-                                break
+        # 关键词或选项变化后，之前记录的不含关键词的文件不再有效
+        cache_key = (tuple(search_keywords), flags, self.use_regex_check.isChecked())
+        if cache_key != self._no_match_cache_key:
+            self._no_match_cache = {}
+            self._no_match_cache_key = cache_key
+        
+        # 搜索结果在主线程中逐个文件累计
+        self._search_keywords = search_keywords
+        self._search_use_regex = self.use_regex_check.isChecked()
+        self._total_matches = 0
+        self._files_with_matches = 0
+        
+        # 在后台线程中并发读取和搜索文件，结果按文件顺序交给主线程输出日志
+        self.start_file_task(_search_file, files_to_process, (keyword_patterns, byte_filter, automaton, self._no_match_cache),
+                             self.on_search_result, self.on_search_finished)
+    
+    def start_file_task(self, func, file_paths, args, on_result, on_finished, process_workers=0):
+        """在QThreadPool中启动后台文件任务，执行期间禁用操作按钮"""
+        task = _FileTask(func, file_paths, *args, process_workers=process_workers)
+        task.signals.result.connect(on_result)
+        task.signals.result.connect(self.on_task_progress)
+        task.signals.finished.connect(on_finished)
+        self._task = task
+        self.progress_bar.setRange(0, len(file_paths))
+        self.progress_bar.setValue(0)
+        self.set_running(True)
+        QThreadPool.globalInstance().start(task)
+    
+    def set_running(self, running):
+        """后台任务执行期间禁用搜索和替换按钮，避免重复启动"""
+        self.preview_btn.setEnabled(not running)
+        self.replace_btn.setEnabled(not running)
+        self.progress_bar.setVisible(running)
+    
+    def on_task_progress(self, file_path, future):
+        """每处理完一个文件，进度加一"""
+        if self._task is not None:
+            self.progress_bar.setValue(self.progress_bar.value() + 1)
+    
+    def append_log(self, text):
+        """
+        缓存一行日志，定时或积累到一定行数后一次性写入日志区域
+        每次写入都会触发文本重排和重绘，逐行写入在文件很多时会占用大量时间
+        """
+        self._log_buffer.append(text)
+        if len(self._log_buffer) >= _LOG_FLUSH_LINES:
+            self.flush_log()
+        elif not self._log_timer.isActive():
+            self._log_timer.start()
+    
+    def flush_log(self):
+        """
+        将缓存的日志一次性写入日志区域
+        日志中包含文件内容，按纯文本插入到文档末尾，不会像append那样把类似HTML的内容当作富文本解析
+        """
+        self._log_timer.stop()
+        if not self._log_buffer:
+            return
+        text = "\n".join(self._log_buffer)
+        self._log_buffer.clear()
+        
+        # 与append一致：原来显示在底部时，写入后继续滚动到底部
+        scroll_bar = self.log_edit.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        cursor = QTextCursor(self.log_edit.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not self.log_edit.document().isEmpty():
+            text = "\n" + text
+        cursor.insertText(text)
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+    
+    def closeEvent(self, event):
+        """关闭窗口时取消正在执行的后台任务"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.set_running(False)
+        super().closeEvent(event)
+    
+    def on_search_result(self, file_path, future):
+        """处理单个文件的搜索结果"""
+        # 任务已取消时忽略剩余结果
+        if self._task is None:
+            return
+        
+        search_keywords = self._search_keywords
+        rel_path = self.get_rel_path(file_path)
+        try:
+            # 读取文件并查找包含关键词的句子
+            content, unique_matches, (mtime_ns, file_size) = future.result()
+            
+            if unique_matches:
+                self._files_with_matches += 1
+                self._total_matches += len(unique_matches)
+                # 只记录文件路径和匹配数，替换时重新读取文件，不在内存中保留所有文件的内容
+                self.preview_results.append((file_path, mtime_ns, file_size, len(unique_matches)))
                 
-                # 如果没有找到句子位置或者句子数量为0，回退到原始的按位置去重逻辑
-                if not unique_matches and all_matches:
-                    # 去重，按位置排序
-                    seen_positions = set()
-                    unique_matches = []
-                    for match in all_matches:
-                        if isinstance(match, re.Match):
-                            pos = match.start()
-                            if pos not in seen_positions:
-                                seen_positions.add(pos)
-                                unique_matches.append(match)
-                        else:
-                            pos = match
-                            if pos not in seen_positions:
-                                seen_positions.add(pos)
-                                unique_matches.append(match)
+                # 显示文件中找到的匹配数，在文件之间添加空行
+                self.append_log("")
+                self.append_log(f"在 【{rel_path}】 中找到 {len(unique_matches)} 处匹配")
                 
-                if unique_matches:
-                    files_with_matches += 1
-                    total_matches += len(unique_matches)
-                    self.preview_results.append((file_path, content, len(unique_matches)))
-                    
-                    # 显示文件中找到的匹配数
-                    try:
-                        # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                        rel_path = os.path.relpath(file_path, self.folder_path)
-                    except ValueError:
-                        # 如果路径在不同驱动器上，直接使用文件名
-                        rel_path = os.path.basename(file_path)
-                    # 在文件之间添加空行
-                    self.log_edit.append("")
-                    self.log_edit.append(f"在 【{rel_path}】 中找到 {len(unique_matches)} 处匹配")
-                    
-                    # 显示完整匹配内容
-                    if self.use_regex_check.isChecked():
-                        # 对于正则表达式，显示所有匹配
-                        for i, match in enumerate([m for m in unique_matches if isinstance(m, re.Match)]):
-                            start = max(0, match.start() - 20)
-                            end = min(len(content), match.end() + 20)
-                            context = content[start:end]
-                            # 在命中之间添加空行（除了第一个命中）
-                            if i > 0:
-                                self.log_edit.append("")
-                            self.log_edit.append(f"^^^^^^^^^【{rel_path}】 匹配 {i+1}:^^^^^^^^^")
-                            self.log_edit.append(f"{context}")
-                    else:
-                        # 对于普通文本，显示所有匹配位置的上下文
-                        for i, pos in enumerate([m.start() if isinstance(m, re.Match) else m for m in unique_matches]):
-                            # 使用第一个关键词估算长度（实际匹配可能来自不同关键词）
-                            keyword_len = len(search_keywords[0]) if search_keywords else 0
-                            start = max(0, pos - 20)
-                            end = min(len(content), pos + keyword_len + 20)
-                            context = content[start:end]
-                            # 在命中之间添加空行（除了第一个命中）
-                            if i > 0:
-                                self.log_edit.append("")
-                            self.log_edit.append(f"^^^^^^^^^【{rel_path}】 匹配 {i+1}:^^^^^^^^^")
-                            self.log_edit.append(f"{context}")
-        
-            except UnicodeDecodeError:
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"跳过二进制文件: {rel_path}")
-            except Exception as e:
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"处理文件 {rel_path} 时出错: {str(e)}")
+                # 显示完整匹配内容
+                if self._search_use_regex:
+                    # 对于正则表达式，显示所有匹配
+                    for i, match in enumerate([m for m in unique_matches if isinstance(m, re.Match)]):
+                        start = max(0, match.start() - 20)
+                        end = min(len(content), match.end() + 20)
+                        context = content[start:end]
+                        # 在命中之间添加空行（除了第一个命中）
+                        if i > 0:
+                            self.append_log("")
+                        self.append_log(f"^^^^^^^^^【{rel_path}】 匹配 {i+1}:^^^^^^^^^")
+                        self.append_log(f"{context}")
+                else:
+                    # 对于普通文本，显示所有匹配位置的上下文
+                    for i, pos in enumerate([m.start() if isinstance(m, re.Match) else m for m in unique_matches]):
+                        # 使用第一个关键词估算长度（实际匹配可能来自不同关键词）
+                        keyword_len = len(search_keywords[0]) if search_keywords else 0
+                        start = max(0, pos - 20)
+                        end = min(len(content), pos + keyword_len + 20)
+                        context = content[start:end]
+                        # 在命中之间添加空行（除了第一个命中）
+                        if i > 0:
+                            self.append_log("")
+                        self.append_log(f"^^^^^^^^^【{rel_path}】 匹配 {i+1}:^^^^^^^^^")
+                        self.append_log(f"{context}")
+    
+        except UnicodeDecodeError:
+            self.append_log(f"跳过二进制文件: {rel_path}")
+        except Exception as e:
+            self.append_log(f"处理文件 {rel_path} 时出错: {str(e)}")
+    
+    def on_search_finished(self):
+        """搜索任务完成"""
+        if self._task is None:
+            return
+        self._task = None
+        self.set_running(False)
+        self.flush_log()
         
+        total_matches = self._total_matches
+        files_with_matches = self._files_with_matches
         self.log_edit.append(f"\n搜索完成！")
         self.log_edit.append(f"在 {files_with_matches} 个文件中找到 {total_matches} 处匹配")
         
@@ -713,6 +1213,12 @@ class SearchReplaceDialog(QDialog):
             QMessageBox.information(self, "搜索完成", f"在 {files_with_matches} 个文件中找到 {total_matches} 处匹配\n点击'替换'执行实际替换操作")
         else:
             QMessageBox.information(self, "未找到匹配", "没有找到与搜索条件匹配的内容")
+        
+        # 由替换操作发起的搜索，完成后继续执行替换
+        if self._replace_after_search:
+            self._replace_after_search = False
+            if self.preview_results:
+                self.start_replace()
     
     def start_replace(self):
         """开始执行替换操作"""
@@ -735,14 +1241,16 @@ class SearchReplaceDialog(QDialog):
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply != QMessageBox.StandardButton.Yes:
                 return
-            # 执行搜索以获取文件列表
+            # 执行搜索以获取文件列表，搜索在后台执行，完成后如果有结果会继续执行替换
+            self._replace_after_search = True
             self.preview_replace()
-            # 如果还是没有结果，直接返回
-            if not self.preview_results:
-                return
+            if self._task is None:
+                # 搜索没有启动（如正则表达式有误）
+                self._replace_after_search = False
+            return
         
         # 再次确认替换操作
-        total_matches = sum(count for _, _, count in self.preview_results)
+        total_matches = sum(count for _, _, _, count in self.preview_results)
         reply = QMessageBox.question(self, "确认替换", f"确定要替换所有 {total_matches} 处匹配吗？\n此操作无法撤销！", 
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
@@ -752,94 +1260,73 @@ class SearchReplaceDialog(QDialog):
         self.log_edit.append("\n开始执行替换操作...")
         self.log_edit.append(f"替换关键词: {', '.join(search_keywords)}")
         
-        files_changed = 0
-        total_replaced = 0
-        errors = 0
-        
         replace_text = self.replace_edit.text()
         
-        for file_path, original_content, _ in self.preview_results:
-            try:
-                # 执行替换，同时按照句子级别计算匹配数
-                flags = 0 if self.case_sensitive_check.isChecked() else re.IGNORECASE
-                new_content = original_content
-                
-                # 按句子分割文本（使用中英文句号、问号、感叹号作为分隔符）
-                sentences = re.split(r'[.!?。？！]+', original_content)
-                # 保存每个句子的起始和结束位置
-                sentence_positions = []
-                current_pos = 0
-                for sentence in sentences:
-                    # 查找句子在原始文本中的实际位置
-                    pos = original_content.find(sentence, current_pos)
-                    if pos != -1:
-                        # 查找句子后面的分隔符
-                        separator_end = pos + len(sentence)
-                        while separator_end < len(original_content) and original_content[separator_end] in '.!?。？！':
-                            separator_end += 1
-                        sentence_positions.append((pos, separator_end))
-                        current_pos = separator_end
-                
-                # 统计包含至少一个关键词的句子数量
-                matched_sentence_indices = set()
-                for keyword in search_keywords:
-                    if self.use_regex_check.isChecked():
-                        matches = list(re.finditer(keyword, original_content, flags))
-                    else:
-                        if self.case_sensitive_check.isChecked():
-                            matches = [match for match in re.finditer(re.escape(keyword), original_content)]
-                        else:
-                            matches = [match for match in re.finditer(re.escape(keyword), original_content, re.IGNORECASE)]
-                    
-                    # 对于每个匹配，找出它属于哪个句子
-                    for match in matches:
-                        match_pos = match.start()
-                        for i, (sentence_start, sentence_end) in enumerate(sentence_positions):
-                            if sentence_start <= match_pos < sentence_end:
-                                matched_sentence_indices.add(i)
-                                break
-                
-                # 执行实际替换
-                total_count = 0
-                for keyword in search_keywords:
-                    if self.use_regex_check.isChecked():
-                        new_content, count = re.subn(keyword, replace_text, new_content, flags=flags)
-                    else:
-                        if self.case_sensitive_check.isChecked():
-                            count = new_content.count(keyword)
-                            new_content = new_content.replace(keyword, replace_text)
-                        else:
-                            # 不区分大小写的字符串替换
-                            new_content = re.sub(re.escape(keyword), replace_text, new_content, flags=re.IGNORECASE)
-                            count = len(re.findall(re.escape(keyword), original_content, flags=re.IGNORECASE))
-                    # 注意：这里的count是实际替换次数，但我们统计的是句子数量
-                
-                # 使用句子级别的计数作为替换计数
-                count = len(matched_sentence_indices)
-                
-                # 写入新内容
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                
-                files_changed += 1
-                total_replaced += count
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"已替换 {rel_path} 中的 {count} 处匹配")
-                
-            except Exception as e:
-                errors += 1
-                try:
-                    # 尝试获取相对路径，如果在不同驱动器则使用文件名
-                    rel_path = os.path.relpath(file_path, self.folder_path)
-                except ValueError:
-                    # 如果路径在不同驱动器上，直接使用文件名
-                    rel_path = os.path.basename(file_path)
-                self.log_edit.append(f"替换 {rel_path} 时出错: {str(e)}")
+        # 关键词只编译一次，所有文件共用
+        flags = 0 if self.case_sensitive_check.isChecked() else re.IGNORECASE
+        try:
+            keyword_patterns = _compile_keywords(search_keywords, self.use_regex_check.isChecked(), flags)
+        except re.error as e:
+            self.log_edit.append(f"正则表达式错误: {str(e)}")
+            QMessageBox.warning(self, "警告", f"正则表达式错误: {str(e)}")
+            return
+        count_patterns = _combine_keyword_patterns(search_keywords, keyword_patterns,
+                                                   self.use_regex_check.isChecked(), flags)
+        # 与搜索时一样，多个普通文本关键词用自动机一次扫描统计包含关键词的句子
+        automaton = _build_automaton(search_keywords, self.use_regex_check.isChecked(),
+                                     self.case_sensitive_check.isChecked())
+        
+        # 替换结果在主线程中逐个文件累计
+        self._files_changed = 0
+        self._total_replaced = 0
+        self._replace_errors = 0
+        
+        # 在后台并发替换文件，结果按文件顺序交给主线程输出日志；文件总大小较大且有多个CPU时使用进程池
+        literal_replace = not self.use_regex_check.isChecked() and self.case_sensitive_check.isChecked()
+        file_paths = [file_path for file_path, _, _, _ in self.preview_results]
+        mtimes = {file_path: mtime_ns for file_path, mtime_ns, _, _ in self.preview_results}
+        total_bytes = sum(file_size for _, _, file_size, _ in self.preview_results)
+        self.start_file_task(_replace_file, file_paths,
+                             (search_keywords, keyword_patterns, count_patterns, replace_text, literal_replace, mtimes,
+                              automaton),
+                             self.on_replace_result, self.on_replace_finished,
+                             process_workers=_process_worker_count(len(file_paths), total_bytes))
+    
+    def on_replace_result(self, file_path, future):
+        """处理单个文件的替换结果"""
+        # 任务已取消时忽略剩余结果
+        if self._task is None:
+            return
+        
+        rel_path = self.get_rel_path(file_path)
+        try:
+            count, written = future.result()
+            
+            if not written:
+                self.append_log(f"跳过: {rel_path} 替换后内容没有变化")
+                return
+            
+            self._files_changed += 1
+            self._total_replaced += count
+            self.append_log(f"已替换 {rel_path} 中的 {count} 处匹配")
+            
+        except _FileChangedError:
+            self.append_log(f"跳过: {rel_path} 在搜索后已被修改，请重新搜索")
+        except Exception as e:
+            self._replace_errors += 1
+            self.append_log(f"替换 {rel_path} 时出错: {str(e)}")
+    
+    def on_replace_finished(self):
+        """替换任务完成"""
+        if self._task is None:
+            return
+        self._task = None
+        self.set_running(False)
+        self.flush_log()
+        
+        files_changed = self._files_changed
+        total_replaced = self._total_replaced
+        errors = self._replace_errors
         
         # 完成消息
         self.log_edit.append(f"\n替换完成！")
@@ -847,4 +1334,4 @@ class SearchReplaceDialog(QDialog):
         self.log_edit.append(f"替换总数: {total_replaced} 处")
         self.log_edit.append(f"失败: {errors} 个文件")
         
-        QMessageBox.information(self, "完成", f"替换操作已完成！\n成功修改: {files_changed} 个文件\n替换总数: {total_replaced} 处\n失败: {errors} 个文件")
\ No newline at end of file
+        QMessageBox.information(self, "完成", f"替换操作已完成！\n成功修改: {files_changed} 个文件\n替换总数: {total_replaced} 处\n失败: {errors} 个文件")
@@ -4,7 +4,7 @@
 """
 import sys
 import os
-from datetime import datetime
+from datetime import datetime, date
 from PyQt6.QtWidgets import (
     QApplication, QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox,
@@ -15,7 +15,7 @@ from PyQt6.QtGui import QFont, QColor, QIcon
 
 # 导入数据库模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from database import execute_query, execute_non_query, create_table, table_exists
+from database import execute_query, execute_non_query, execute_many, create_table, table_exists, transaction
 # 导入密码加密模块
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from tools.other_tools.password_manager import PasswordEncryption
@@ -27,6 +27,11 @@ class DateCounterDialog(QDialog):
     支持记录多个日期并为每个日期添加标题，计算日期之间的天数差异
     """
     
+    # 距今天数的颜色，所有行共用，不为每一行重新创建
+    FUTURE_COLOR = QColor("blue")  # 未来日期
+    PAST_COLOR = QColor("red")  # 过去日期
+    TODAY_COLOR = QColor("green")  # 今天
+    
     def __init__(self, parent=None):
         """
         初始化日期计数对话框
@@ -47,12 +52,9 @@ class DateCounterDialog(QDialog):
         
         # 从config.json中获取窗口标题（使用工具名称）
         window_title = "日期计数"  # 默认标题
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if hasattr(tool, 'class_name') and tool.class_name == 'DateCounterDialog':
-                    window_title = tool.name
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            window_title = tool.name
         
         # 设置窗口标题和大小
         self.setWindowTitle(window_title)
@@ -355,10 +357,12 @@ class DateCounterDialog(QDialog):
         清空所有日期数据
         """
         try:
-            # 删除所有日期记录
-            execute_non_query('DELETE FROM date_records')
-            # 重置自增ID
-            execute_non_query('DELETE FROM sqlite_sequence WHERE name="date_records"')
+            # 两条语句在同一个事务中执行，只提交一次
+            with transaction():
+                # 删除所有日期记录
+                execute_non_query('DELETE FROM date_records')
+                # 重置自增ID
+                execute_non_query('DELETE FROM sqlite_sequence WHERE name="date_records"')
         except Exception as e:
             print(f"清空日期数据时出错: {str(e)}")
     
@@ -498,6 +502,10 @@ class DateCounterDialog(QDialog):
         """
         从数据库加载日期记录
         """
+        # 填充期间暂停表格重绘，下拉框不发出选择变化信号，全部填充完成后只刷新一次
+        self.dates_table.setUpdatesEnabled(False)
+        self.start_date_combo.blockSignals(True)
+        self.end_date_combo.blockSignals(True)
         try:
             # 清空表格和下拉框
             self.dates_table.setRowCount(0)
@@ -508,13 +516,13 @@ class DateCounterDialog(QDialog):
             records = execute_query("SELECT id, title, date FROM date_records ORDER BY order_index ASC")
             
             # 获取当前日期用于计算天数差
-            current_date = datetime.now().date()
+            current_date = date.today()
+            
+            # 一次性分配所有行，不逐行插入
+            self.dates_table.setRowCount(len(records))
             
             # 添加记录到表格和下拉框
-            for record in records:
-                row_position = self.dates_table.rowCount()
-                self.dates_table.insertRow(row_position)
-                
+            for row_position, record in enumerate(records):
                 try:
                     # 解密标题和日期
                     decrypted_title = PasswordEncryption.decrypt(record['title'])
@@ -531,17 +539,18 @@ class DateCounterDialog(QDialog):
                 # 计算并显示距今天数（只有在解密成功时）
                 if decrypted_date != "[解密失败]":
                     try:
-                        record_date = datetime.strptime(decrypted_date, "%Y-%m-%d").date()
+                        # 日期统一保存为 yyyy-MM-dd 格式，fromisoformat比strptime解析快得多
+                        record_date = date.fromisoformat(decrypted_date)
                         days_diff = (current_date - record_date).days
                         diff_item = QTableWidgetItem(str(days_diff))
                         
                         # 根据正负设置颜色
                         if days_diff < 0:
-                            diff_item.setForeground(QColor("blue"))  # 未来日期
+                            diff_item.setForeground(self.FUTURE_COLOR)
                         elif days_diff > 0:
-                            diff_item.setForeground(QColor("red"))  # 过去日期
+                            diff_item.setForeground(self.PAST_COLOR)
                         else:
-                            diff_item.setForeground(QColor("green"))  # 今天
+                            diff_item.setForeground(self.TODAY_COLOR)
                         
                         self.dates_table.setItem(row_position, 2, diff_item)
                     except ValueError:
@@ -565,6 +574,10 @@ class DateCounterDialog(QDialog):
             self._update_button_states()
         except Exception as e:
             QMessageBox.critical(self, "错误", f"加载日期记录失败: {str(e)}")
+        finally:
+            self.start_date_combo.blockSignals(False)
+            self.end_date_combo.blockSignals(False)
+            self.dates_table.setUpdatesEnabled(True)
     
     def calculate_difference(self):
         """计算两个日期之间的差异"""
@@ -582,8 +595,8 @@ class DateCounterDialog(QDialog):
         end_date_data = self.end_date_combo.currentData()
         
         # 解析日期
-        start_date = datetime.strptime(start_date_data[1], "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date_data[1], "%Y-%m-%d").date()
+        start_date = date.fromisoformat(start_date_data[1])
+        end_date = date.fromisoformat(end_date_data[1])
         
         # 计算差异
         days_diff = (end_date - start_date).days
@@ -649,25 +662,29 @@ class DateCounterDialog(QDialog):
             
             # 更新数据库中的排序（交换排序索引）
             try:
-                # 获取两行的排序索引
-                current_record = execute_query("SELECT order_index FROM date_records WHERE id = ?", (current_id,))[0]
-                prev_record = execute_query("SELECT order_index FROM date_records WHERE id = ?", (prev_id,))[0]
-                
-                # 交换排序索引
-                execute_non_query(
-                    "UPDATE date_records SET order_index = ? WHERE id = ?",
-                    (current_record['order_index'], prev_id)
-                )
-                execute_non_query(
-                    "UPDATE date_records SET order_index = ? WHERE id = ?",
-                    (prev_record['order_index'], current_id)
-                )
+                self._swap_order_index(current_id, prev_id)
                 
                 # 重新加载数据（包括解密显示）
                 self.load_dates()
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"排序失败: {str(e)}")
     
+    def _swap_order_index(self, first_id, second_id):
+        """
+        交换两条记录的排序索引
+        一次查询取出两行的排序索引，两条更新批量执行，整个交换在同一个事务中完成
+        """
+        with transaction():
+            rows = execute_query(
+                "SELECT id, order_index FROM date_records WHERE id IN (?, ?)",
+                (first_id, second_id)
+            )
+            order_index = {row['id']: row['order_index'] for row in rows}
+            execute_many(
+                "UPDATE date_records SET order_index = ? WHERE id = ?",
+                [(order_index[second_id], first_id), (order_index[first_id], second_id)]
+            )
+    
     def _update_button_states(self):
         """
         更新所有按钮的启用状态
@@ -703,19 +720,7 @@ class DateCounterDialog(QDialog):
             
             # 更新数据库中的排序（交换排序索引）
             try:
-                # 获取两行的排序索引
-                current_record = execute_query("SELECT order_index FROM date_records WHERE id = ?", (current_id,))[0]
-                next_record = execute_query("SELECT order_index FROM date_records WHERE id = ?", (next_id,))[0]
-                
-                # 交换排序索引
-                execute_non_query(
-                    "UPDATE date_records SET order_index = ? WHERE id = ?",
-                    (current_record['order_index'], next_id)
-                )
-                execute_non_query(
-                    "UPDATE date_records SET order_index = ? WHERE id = ?",
-                    (next_record['order_index'], current_id)
-                )
+                self._swap_order_index(current_id, next_id)
                 
                 # 重新加载数据（包括解密显示）
                 self.load_dates()
@@ -798,7 +803,7 @@ class DateCounterDialog(QDialog):
                 try:
                     # 解析当前日期（如果不是解密失败的情况）
                     if current_value != "[解密失败]":
-                        current_date = datetime.strptime(current_value, "%Y-%m-%d").date()
+                        current_date = date.fromisoformat(current_value)
                         qdate = QDate(current_date.year, current_date.month, current_date.day)
                     else:
                         # 使用当前日期作为默认值
@@ -317,12 +317,9 @@ class PasswordManagerDialog(QDialog):
         
         # 从config.json中获取窗口标题（使用工具名称）
         window_title = "密码管理器"  # 默认标题
-        if parent and hasattr(parent, 'tools'):
-            # 查找当前工具的配置
-            for tool in parent.tools:
-                if tool.class_name == 'PasswordManagerDialog':
-                    window_title = tool.name
-                    break
+        tool = getattr(parent, 'tools_by_class', {}).get(type(self).__name__)
+        if tool:
+            window_title = tool.name
         # 设置窗口标题和大小
         self.setWindowTitle(window_title)
         self.setMinimumWidth(1000)